@@ -0,0 +1,72 @@
+"""
+    Recall@k and latency of the IVF approximate search against the exact
+    EmbeddingIndex search, for several n_probe values, on clustered synthetic
+    embeddings (real sentence embeddings are clustered by topic too).
+
+    Run from srcs/: python -m bench.bench_ann [--rows 100000] [--probes 1 2 4 8 16 32]
+"""
+import argparse
+import json
+import time
+import numpy as np
+from loguru import logger
+from search.EmbeddingIndex import EmbeddingIndex
+from search.IVFIndex import IVFIndex
+
+def clustered_vectors(rows: int, dim: int, topics: int, spread: float, seed: int = 0) -> np.ndarray:
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dim), dtype=np.float32)
+    labels = rng.integers(0, topics, rows)
+    return centers[labels] + spread * rng.standard_normal((rows, dim), dtype=np.float32)
+
+def mean_latency_ms(search, queries: np.ndarray) -> float:
+
+    start = time.perf_counter()
+    for query in queries:
+        search(query)
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+def run(rows: int, dim: int, queries: int, k: int, probes: list[int], n_lists: int) -> dict:
+
+    vectors = clustered_vectors(rows + queries, dim, topics=max(8, rows // 500), spread=0.8)
+    index = EmbeddingIndex(capacity=rows)
+    index.add(range(rows), vectors[:rows])
+    query_vectors = vectors[rows:]
+    start = time.perf_counter()
+    ivf = IVFIndex(index).build(n_lists)
+    build_seconds = time.perf_counter() - start
+    exact = [{offer_id for offer_id, _ in index.search(query, k)} for query in query_vectors]
+    results = {
+        "rows": rows,
+        "dim": dim,
+        "n_lists": ivf.n_lists,
+        "build_seconds": round(build_seconds, 3),
+        "exact_latency_ms": round(mean_latency_ms(lambda q: index.search(q, k), query_vectors), 3),
+        "ann": [],
+    }
+    for n_probe in probes:
+        found = [{offer_id for offer_id, _ in ivf.search(query, k, n_probe)} for query in query_vectors]
+        recall = np.mean([len(a & b) / k for a, b in zip(found, exact)])
+        results["ann"].append({
+            "n_probe": n_probe,
+            f"recall@{k}": round(float(recall), 4),
+            "latency_ms": round(mean_latency_ms(lambda q: ivf.search(q, k, n_probe), query_vectors), 3),
+        })
+    return results
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=None)
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+    logger.remove()
+    print(json.dumps(run(args.rows, args.dim, args.queries, args.k, args.probes, args.n_lists), indent=2))
+
+if __name__ == '__main__':
+    main()
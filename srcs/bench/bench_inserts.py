@@ -0,0 +1,85 @@
+"""
+    Offers insert throughput of DBManager.insert_offers (one transaction per page,
+    INSERT ... ON CONFLICT DO NOTHING RETURNING id), with and without WAL, against
+    the former executemany + COUNT(*) diffing path.
+
+    Run from srcs/: python -m bench.bench_inserts [--sizes 10000 100000 1000000]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from loguru import logger
+from bench.corpus import SCHEMA_FILE, iter_offer_pages, random_vectors
+from db.DBManager import DBManager
+from utils.vectorize import get_array_as_vector_blob
+
+def make_db(directory: str, wal: bool) -> DBManager:
+
+    db = DBManager({
+        "DB_NAME": os.path.join(directory, "bench.db"),
+        "DB_OFFERS_TABLE": "Offers",
+        "DB_APPLICATION_TABLE": "Applications",
+        "DB_SCHEMA": SCHEMA_FILE,
+        "DB_WAL": "1" if wal else "0",
+    })
+    for table_name in db.schema:
+        db.create_table(table_name, db.schema[table_name])
+    return db
+
+def legacy_insert(db: DBManager, offers: list, langs: list, vectors) -> int:
+
+    count_before = db.get_offers_count()
+    try:
+        db.cursor.executemany(
+            f"INSERT INTO {db.offers_table} ({', '.join(name for name, _ in db.schema[db.offers_table][:18])}) VALUES ({','.join(['?'] * 18)})",
+            [
+                (int(o['id']), o['title'], o['little_description'], o['big_description'], o['salary'],
+                 o['contract_type'], o['email'], o['full_address'], o['valid_at'], o['invalid_at'],
+                 o['min_duration'], o['max_duration'], o['slug'], o['created_at'], int(o['company_id']),
+                 lang, 0, get_array_as_vector_blob(vector))
+                for o, lang, vector in zip(offers, langs, vectors)
+            ]
+        )
+        db.db_connection.commit()
+    except Exception:
+        pass
+    return db.get_offers_count() - count_before
+
+def run(size: int, mode: str, page_size: int, dim: int) -> dict:
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = make_db(directory, wal=(mode == "wal"))
+        insert = legacy_insert if mode == "legacy" else DBManager.insert_offers
+        vectors = random_vectors(page_size, dim)
+        inserted = 0
+        elapsed = 0.0
+        for page in iter_offer_pages(size, page_size):
+            langs = ["fr"] * len(page)
+            start = time.perf_counter()
+            inserted += insert(db, page, langs, vectors[:len(page)])
+            elapsed += time.perf_counter() - start
+        db.db_connection.close()
+    return {
+        "rows": size,
+        "mode": mode,
+        "inserted": inserted,
+        "seconds": round(elapsed, 3),
+        "inserts_per_second": round(inserted / elapsed, 1) if elapsed else None,
+    }
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--modes", nargs="+", default=["legacy", "default", "wal"], choices=["legacy", "default", "wal"])
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+    logger.remove()
+    results = [run(size, mode, args.page_size, args.dim) for size in args.sizes for mode in args.modes]
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
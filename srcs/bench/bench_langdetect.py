@@ -0,0 +1,89 @@
+"""
+    Compares the seeded, memoized batch language detection of utils.language
+    with the former per-call langdetect.detect path: throughput, fr/en
+    agreement between both, and stability of each path across two runs.
+
+    Run from srcs/: python -m bench.bench_langdetect [--size N] [--processes P]
+"""
+import argparse
+import json
+import random
+import time
+import langdetect
+from langdetect.lang_detect_exception import LangDetectException
+import utils.language as language
+
+FR_WORDS = "stage développeur entreprise équipe nous recherchons un une pour notre au sein de la le les des mission vous serez chargé projet données logiciel alternance poste".split()
+EN_WORDS = "internship developer company team we are looking for a an our within the mission you will be in charge of project data software apprenticeship position".split()
+
+def make_corpus(size: int, seed: int = 42) -> list[str]:
+
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(size):
+        words = FR_WORDS if i % 2 == 0 else EN_WORDS
+        corpus.append(" ".join(rng.choice(words) for _ in range(rng.randint(8, 30))))
+    return corpus
+
+def per_call(texts: list[str]) -> list[str]:
+
+    #the former path: one unseeded langdetect.detect call per offer
+    langdetect.DetectorFactory.seed = None
+    langs = []
+    for text in texts:
+        try:
+            langs.append(langdetect.detect(text))
+        except LangDetectException:
+            langs.append(language.UNKNOWN_LANGUAGE)
+    langdetect.DetectorFactory.seed = 0
+    return langs
+
+def batched(texts: list[str], processes: int) -> list[str]:
+
+    language._memo.clear()
+    return language.detect_languages(texts, processes)
+
+def timed(func, *args) -> tuple[list[str], float]:
+
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def agreement(a: list[str], b: list[str]) -> float:
+
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+def run(size: int, duplicates: float, processes: int) -> dict:
+
+    unique = make_corpus(int(size * (1 - duplicates)) or 1)
+    texts = [unique[i % len(unique)] for i in range(size)]
+    old, old_time = timed(per_call, texts)
+    old_again, _ = timed(per_call, texts)
+    new, new_time = timed(batched, texts, processes)
+    new_again, _ = timed(batched, texts, processes)
+    return {
+        "texts": size,
+        "duplicate_ratio": duplicates,
+        "processes": processes,
+        "per_call_texts_per_second": round(size / old_time, 1),
+        "batched_texts_per_second": round(size / new_time, 1),
+        "speedup": round(old_time / new_time, 2),
+        "fr_en_agreement": round(agreement(
+            [lang if lang in ("fr", "en") else "other" for lang in old],
+            [lang if lang in ("fr", "en") else "other" for lang in new],
+        ), 4),
+        "per_call_stability": round(agreement(old, old_again), 4),
+        "batched_stability": round(agreement(new, new_again), 4),
+    }
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=5000)
+    parser.add_argument("--duplicates", type=float, default=0.3, help="share of repeated texts in the corpus")
+    parser.add_argument("--processes", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.size, args.duplicates, args.processes), indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+    Synthetic offers for the benchmarks.
+"""
+import os
+import random
+from typing import Iterator, List
+import numpy as np
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "db", "schema.example.json")
+
+CONTRACT_TYPES = ["internship", "apprenticeship", "cdi", "cdd"]
+FR_WORDS = "stage développeur entreprise équipe nous recherchons un une pour notre au sein de la le les des mission vous serez chargé projet données logiciel".split()
+EN_WORDS = "internship developer company team we are looking for a an our within the mission you will be in charge of project data software".split()
+
+def make_offer(offer_id: int, rng: random.Random) -> dict:
+
+    words = FR_WORDS if rng.random() < 0.7 else EN_WORDS
+    little = " ".join(rng.choice(words) for _ in range(20))
+    return {
+        "id": str(offer_id),
+        "title": f"{rng.choice(words)} {rng.choice(words)} #{offer_id}",
+        "little_description": little,
+        "big_description": " ".join([little] + [rng.choice(words) for _ in range(120)]),
+        "salary": str(rng.randint(600, 2000)),
+        "contract_type": rng.choice(CONTRACT_TYPES),
+        "email": f"hr{rng.randint(0, max(1, offer_id // 4))}@company{offer_id % 997}.com",
+        "full_address": "1 rue de Paris, 75001 Paris",
+        "valid_at": "2026-01-01T00:00:00.000Z",
+        "invalid_at": f"{rng.choice(['2025', '2099'])}-06-01T00:00:00.000Z",
+        "min_duration": rng.randint(1, 3),
+        "max_duration": rng.randint(3, 6),
+        "slug": f"offer-{offer_id}",
+        "created_at": "2026-01-01T00:00:00.000Z",
+        "company_id": str(offer_id % 997),
+    }
+
+def iter_offer_pages(count: int, page_size: int = 1000, start_id: int = 1, seed: int = 42) -> Iterator[List[dict]]:
+
+    rng = random.Random(seed)
+    for start in range(start_id, start_id + count, page_size):
+        yield [make_offer(offer_id, rng) for offer_id in range(start, min(start + page_size, start_id + count))]
+
+def random_vectors(count: int, dim: int = 384, seed: int = 0) -> np.ndarray:
+
+    return np.random.default_rng(seed).standard_normal((count, dim), dtype=np.float32)
+
+SIZES = [1000, 10000, 100000, 1000000]
+
+def bench_config(db_name: str, **overrides) -> dict:
+
+    return {
+        "DB_NAME": db_name,
+        "DB_OFFERS_TABLE": "Offers",
+        "DB_APPLICATION_TABLE": "Applications",
+        "DB_SCHEMA": SCHEMA_FILE,
+        **overrides,
+    }
+
+def build_database(db_name: str, rows: int, dim: int = 384, applied_ratio: float = 0.1, page_size: int = 1000, seed: int = 42):
+    """
+        Creates (or reuses, when it already holds <rows> offers) a synthetic
+        Offers/Applications database of <rows> offers, <applied_ratio> of which
+        have been applied to. Returns the open DBManager.
+    """
+
+    from db.DBManager import DBManager
+    db = DBManager(bench_config(db_name))
+    for table_name in db.schema:
+        db.create_table(table_name, db.schema[table_name])
+    if db.get_offers_count() == rows:
+        return db
+    rng = random.Random(seed)
+    columns = db.schema[db.application_table][1:-1]
+    for page_number, page in enumerate(iter_offer_pages(rows, page_size, seed=seed)):
+        vectors = random_vectors(len(page), dim, seed=page_number)
+        db.insert_offers(page, [rng.choice(["fr", "en"]) for _ in page], vectors)
+        applied = [offer for offer in page if rng.random() < applied_ratio]
+        db.record_applications([
+            ("me@example.com", offer["email"], offer["created_at"], f"msg{offer['id']}", f"msg{offer['id']}", 0, None, None, int(offer["id"]))
+            for offer in applied
+        ], columns)
+    db.cursor.execute("ANALYZE")
+    return db
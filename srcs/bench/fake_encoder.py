@@ -0,0 +1,34 @@
+"""
+    Deterministic stand-in for SentenceTransformer: no model download, and the
+    same text always gets the same unit vector.
+"""
+import hashlib
+from typing import List, Union
+import numpy as np
+
+class FakeSentenceTransformer:
+
+    dim: int
+
+    def __init__(self, model_name: str = "fake-minilm", dim: int = 384):
+
+        self.model_name = model_name
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+
+        return self.dim
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+
+        if isinstance(sentences, str):
+            return self.encode_one(sentences)
+        if not sentences:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.stack([self.encode_one(sentence) for sentence in sentences])
+
+    def encode_one(self, sentence: str) -> np.ndarray:
+
+        seed = int.from_bytes(hashlib.blake2b(sentence.encode("utf-8"), digest_size=8).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
@@ -0,0 +1,166 @@
+"""
+    In-memory fake of the subset of the Gmail API service used by DeliveryMachine.
+"""
+import itertools
+from typing import Any, Callable, Dict, List
+import httplib2
+from googleapiclient.errors import HttpError
+
+class FakeRequest:
+
+    def __init__(self, execute: Callable[[], Any]):
+
+        self._execute = execute
+
+    def execute(self) -> Any:
+
+        return self._execute()
+
+class FakeBatch:
+
+    def __init__(self, callback: Callable):
+
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request: FakeRequest, request_id: str = None) -> None:
+
+        self.requests.append((request_id, request))
+
+    def execute(self) -> None:
+
+        for request_id, request in self.requests:
+            try:
+                self.callback(request_id, request.execute(), None)
+            except Exception as e:
+                self.callback(request_id, None, e)
+
+class FakeGmailService:
+
+    def __init__(self):
+
+        self.ids = itertools.count(1)
+        self.sent: List[Dict] = []
+        self.drafts_created: List[Dict] = []
+        self.label_list: List[Dict] = []
+        self.labelled: Dict[str, List[str]] = {}
+        self.resource = None
+        #mailbox history: (history id, added message) records, oldest first
+        self.history_records: List[tuple] = []
+        self.history_id = 1
+        self.oldest_history_id = 1
+        self.history_page_size = 100
+
+    def new_batch_http_request(self, callback: Callable = None) -> FakeBatch:
+
+        return FakeBatch(callback)
+
+    def users(self) -> "FakeGmailService":
+
+        return self
+
+    def messages(self) -> "FakeGmailService":
+
+        self.resource = "messages"
+        return self
+
+    def drafts(self) -> "FakeGmailService":
+
+        self.resource = "drafts"
+        return self
+
+    def labels(self) -> "FakeGmailService":
+
+        self.resource = "labels"
+        return self
+
+    def history(self) -> "FakeGmailService":
+
+        self.resource = "history"
+        return self
+
+    def getProfile(self, userId: str) -> FakeRequest:
+
+        return FakeRequest(lambda: {"historyId": str(self.history_id)})
+
+    def list(self, userId: str, **kwargs) -> FakeRequest:
+
+        if self.resource == "history":
+            return FakeRequest(lambda: self.list_history(**kwargs))
+        return FakeRequest(lambda: {"labels": list(self.label_list)})
+
+    def list_history(self, startHistoryId: str, historyTypes: List[str] = None, pageToken: str = None) -> Dict:
+
+        start = int(startHistoryId)
+        if start < self.oldest_history_id:
+            raise HttpError(httplib2.Response({"status": 404}), b"Requested entity was not found.")
+        records = [record for record in self.history_records if record[0] > start]
+        offset = int(pageToken or 0)
+        page = records[offset:offset + self.history_page_size]
+        response = {
+            "history": [{"id": str(history_id), "messagesAdded": [{"message": message}]} for history_id, message in page],
+            "historyId": str(self.history_id),
+        }
+        if offset + self.history_page_size < len(records):
+            response["nextPageToken"] = str(offset + self.history_page_size)
+        return response
+
+    def add_to_history(self, message: Dict) -> None:
+
+        self.history_id += 1
+        self.history_records.append((self.history_id, message))
+
+    def receive(self, thread_id: str) -> Dict:
+        """
+            Simulates an incoming message in <thread_id>, e.g. a reply to a sent application.
+        """
+
+        message = {"id": f"{next(self.ids):x}", "threadId": thread_id, "labelIds": ["INBOX", "UNREAD"]}
+        self.add_to_history(message)
+        return message
+
+    def expire_history(self) -> None:
+        """
+            Forgets the history records, like Gmail does after about a week.
+        """
+
+        self.history_records = []
+        self.oldest_history_id = self.history_id
+
+    def create(self, userId: str, body: Dict) -> FakeRequest:
+
+        if self.resource == "labels":
+            def create_label():
+                label = {"id": f"Label_{next(self.ids)}", "name": body["name"]}
+                self.label_list.append(label)
+                return label
+            return FakeRequest(create_label)
+
+        def create_draft():
+            message_id = f"{next(self.ids):x}"
+            draft = {"id": f"r{message_id}", "message": {"id": message_id, "threadId": message_id}}
+            self.drafts_created.append(draft)
+            self.add_to_history(dict(draft["message"], labelIds=["DRAFT"]))
+            return draft
+        return FakeRequest(create_draft)
+
+    def send(self, userId: str, body: Dict) -> FakeRequest:
+
+        def send_message():
+            message_id = f"{next(self.ids):x}"
+            message = {"id": message_id, "threadId": message_id, "labelIds": ["SENT"]}
+            self.sent.append(message)
+            self.add_to_history(message)
+            return message
+        return FakeRequest(send_message)
+
+    def modify(self, userId: str, id: str, body: Dict) -> FakeRequest:
+
+        return FakeRequest(lambda: self.labelled.setdefault(id, []).extend(body["addLabelIds"]))
+
+    def batchModify(self, userId: str, body: Dict) -> FakeRequest:
+
+        def batch_modify():
+            for message_id in body["ids"]:
+                self.labelled.setdefault(message_id, []).extend(body["addLabelIds"])
+        return FakeRequest(batch_modify)
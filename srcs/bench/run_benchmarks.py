@@ -0,0 +1,142 @@
+"""
+    Benchmark suite of the hot paths, on synthetic databases and with a fake encoder:
+    k_search, add_offers_clean, get_internships, DeliveryMachine.create_email and
+    the vector encode/decode helpers. Results are written as JSON so that runs can
+    be compared across commits.
+
+    Run from srcs/: python -m bench.run_benchmarks [--sizes 1000 10000] [--output bench_results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Callable, List
+from loguru import logger
+from bench.corpus import SIZES, build_database, iter_offer_pages, random_vectors
+from bench.fake_encoder import FakeSentenceTransformer
+from bench.fake_gmail import FakeGmailService
+
+def measure(name: str, func: Callable[[], object], repeats: int, **labels) -> dict:
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    result = {
+        "scenario": name,
+        **labels,
+        "repeats": repeats,
+        "min_ms": round(min(timings) * 1000, 3),
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "mean_ms": round(statistics.mean(timings) * 1000, 3),
+    }
+    print(f"{name:<24} {json.dumps(labels):<32} median {result['median_ms']:>10.3f} ms")
+    return result
+
+def bench_vectorize(dim: int, count: int, repeats: int) -> List[dict]:
+
+    from utils.vectorize import (get_array_as_vector_blob, get_array_as_vector_str, get_vector_blob_as_array,
+                                 get_vector_str_as_array, get_vectors_as_matrix)
+    vectors = random_vectors(count, dim)
+    blobs = [get_array_as_vector_blob(vector) for vector in vectors]
+    halves = [get_array_as_vector_blob(vector, "float16") for vector in vectors]
+    strings = [get_array_as_vector_str(vector) for vector in vectors]
+    labels = {"vectors": count, "dim": dim}
+    return [
+        measure("vector_str_encode", lambda: [get_array_as_vector_str(v) for v in vectors], repeats, **labels),
+        measure("vector_str_decode", lambda: [get_vector_str_as_array(s) for s in strings], repeats, **labels),
+        measure("vector_blob_encode", lambda: [get_array_as_vector_blob(v) for v in vectors], repeats, **labels),
+        measure("vector_blob_decode", lambda: [get_vector_blob_as_array(b) for b in blobs], repeats, **labels),
+        measure("vector_blob16_decode", lambda: [get_vector_blob_as_array(b, "float16") for b in halves], repeats, **labels),
+        measure("vector_matrix_decode", lambda: get_vectors_as_matrix(blobs), repeats, **labels),
+    ]
+
+def bench_create_email(directory: str, count: int, repeats: int) -> List[dict]:
+
+    from db.OfferRecord import OfferContact
+    from mailing.DeliveryMachine import DeliveryMachine
+    for lang in ("fr", "en"):
+        with open(os.path.join(directory, f"template_{lang}.html"), "w") as fp:
+            fp.write("<html><body>" + "<p>Bonjour, je vous contacte au sujet de votre offre.</p>" * 40 + "</body></html>")
+        with open(os.path.join(directory, f"cv_{lang}.pdf"), "wb") as fp:
+            fp.write(os.urandom(200 * 1024))
+    config = {key: "" for key in ("DM_CLIENT_ID", "DM_CLIENT_SECRET", "DM_AUTH_URI", "DM_TOKEN_URI", "DM_GMAIL_BASE_URI")}
+    config.update({
+        "DM_SENDER": "me@example.com",
+        "DM_EMAIL_TEMPLATE": os.path.join(directory, "template_xx.html"),
+        "DM_LABEL_NAME": "InternshipFinder",
+    })
+    dm = DeliveryMachine(config, service=FakeGmailService())
+    offers = [OfferContact(i, f"Offer {i}", f"hr{i}@example.com", "fr" if i % 2 else "en") for i in range(count)]
+    attachment = os.path.join(directory, "cv_xx.pdf")
+
+    def create_and_serialize():
+        for offer in offers:
+            dm.create_email(offer, attachment).as_bytes()
+
+    return [measure("create_email", create_and_serialize, repeats, emails=count)]
+
+def bench_database(db_name: str, rows: int, dim: int, repeats: int) -> List[dict]:
+
+    from search.EmbeddingIndex import EmbeddingIndex
+    from search.smart_search import k_search
+    db = build_database(db_name, rows, dim)
+    model = FakeSentenceTransformer(dim=dim)
+    conn = db.db_connection
+    index = EmbeddingIndex().load(conn)
+    labels = {"rows": rows}
+    results = [
+        measure("k_search_cold", lambda: k_search(model, conn, "python backend internship", 10), max(1, repeats // 5), **labels),
+        measure("k_search_warm", lambda: k_search(model, conn, "python backend internship", 10, index), repeats, **labels),
+        measure("get_internships", lambda: list(db.get_internships()), repeats, **labels),
+    ]
+    #one page of 60 offers, half of them already known
+    pages = iter_offer_pages(30 * repeats, 30, start_id=rows + 1, seed=rows)
+    known = list(next(iter_offer_pages(30, 30, start_id=max(1, rows - 29))))
+    results.append(measure("add_offers_clean", lambda: db.add_offers_clean(next(pages) + known, model), repeats, **labels))
+    db.cursor.execute(f"DELETE FROM {db.offers_table} WHERE id > ?", (rows,))
+    db.db_connection.commit()
+    db.db_connection.close()
+    return results
+
+def git_revision() -> str:
+
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "internshipfinder-bench"),
+                        help="where the synthetic databases are kept between runs")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    logger.remove()
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = bench_vectorize(args.dim, 1000, args.repeats)
+    results += bench_create_email(args.data_dir, 100, args.repeats)
+    for rows in args.sizes:
+        results += bench_database(os.path.join(args.data_dir, f"offers_{rows}_{args.dim}.db"), rows, args.dim, args.repeats)
+    report = {
+        "commit": git_revision(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(args.output, "w") as fp:
+        json.dump(report, fp, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,14 @@
 from datetime import datetime, timezone
 from sqlite3 import Connection, Cursor
 import sqlite3
-from typing import Iterator, List, Tuple
-from utils.helpers import load_schema
-from utils.vectorize import get_vector_as_str
-from langdetect import detect
+import time
+from typing import Any, Iterable, Iterator, List, Optional, Tuple, Type
+from db.OfferRecord import OfferContact, Record, iter_records
+from utils.helpers import load_indexes, load_schema
+from utils.vectorize import DEFAULT_EMBED_MODEL, encode_texts, get_array_as_vector_blob, get_vector_as_array
+from utils.language import detect_languages
+import numpy as np
+from utils.metrics import metrics, timed
 from loguru import logger
 
 class DBManager:
@@ -13,8 +17,24 @@ class DBManager:
     db_name: str
     offers_table: str
     application_table: str
+    sync_table: str
+    fts_table: str
+    fts: bool
+    archive_table: str
+    archive: bool
     cursor: Cursor
+    schema_file: str
     schema: dict[str,list[tuple[str,str]]]
+    indexes: dict[str,list[dict]]
+    index: Any
+    embedding_cache: Any
+    vector_dtype: str
+    model_name: str
+    langdetect_processes: int
+    wal: bool
+
+    #model id and dimension of each stored vector, added to the offers table when missing
+    VECTOR_COLUMNS = [("vector_model", "TEXT"), ("vector_dim", "INTEGER")]
 
     def __enter__(self):
         return self
@@ -29,16 +49,160 @@ class DBManager:
         self.db_name = config["DB_NAME"]
         self.offers_table = config["DB_OFFERS_TABLE"]
         self.application_table = config["DB_APPLICATION_TABLE"]
-        self.schema = load_schema(config["DB_SCHEMA"])
+        self.sync_table = config.get("DB_SYNC_TABLE", "SyncState")
+        self.fts_table = config.get("DB_FTS_TABLE", f"{self.offers_table}Fts")
+        self.fts = False
+        self.archive_name = config.get("DB_ARCHIVE_NAME")
+        self.archive_table = config.get("DB_ARCHIVE_TABLE", f"{self.offers_table}Archive")
+        if self.archive_name:
+            self.archive_table = f"archive.{self.archive_table}"
+        self.schema_file = config["DB_SCHEMA"]
+        self.schema = load_schema(self.schema_file)
+        self.indexes = load_indexes(self.schema_file)
+        self.index = None
+        self.embedding_cache = None
+        self.vector_dtype = config.get("DB_VECTOR_DTYPE", "float32")
+        self.model_name = config.get("EMBED_MODEL", DEFAULT_EMBED_MODEL)
+        if self.offers_table in self.schema:
+            names = {name for name, _ in self.schema[self.offers_table]}
+            self.schema[self.offers_table] += [column for column in self.VECTOR_COLUMNS if column[0] not in names]
+        if self.application_table in self.schema:
+            names = [name for name, _ in self.schema[self.application_table]]
+            if "thread_id" not in names and "email_id" in names:
+                self.schema[self.application_table].insert(names.index("email_id") + 1, ("thread_id", "TEXT"))
+        self.langdetect_processes = int(config.get("LANGDETECT_PROCESSES", 0))
+        self.wal = config.get("DB_WAL", "0") == "1"
         try:
             self.db_connection = sqlite3.connect(self.db_name)
             self.cursor = self.db_connection.cursor()
             self.cursor.execute("PRAGMA foreign_keys = ON")
+            self.set_journal_mode(self.db_connection)
+            self.cursor.execute(f"CREATE TABLE IF NOT EXISTS {self.sync_table} (key TEXT PRIMARY KEY, value TEXT)")
+            self.add_vector_columns(self.offers_table)
+            self.add_thread_id_column()
+            self.fts = self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (self.fts_table,)).fetchone() is not None
+            if self.archive_name:
+                self.cursor.execute("ATTACH DATABASE ? AS archive", (self.archive_name,))
+            schema, _, table = self.archive_table.rpartition(".")
+            self.archive = self.cursor.execute(
+                f"SELECT 1 FROM {schema or 'main'}.sqlite_master WHERE name = ?", (table,)
+            ).fetchone() is not None
+            if self.archive:
+                self.add_vector_columns(self.archive_table)
         except Exception as e:
            logger.error(f"Error while connecting to {self.db_name}: {e}")
            exit(1)
         logger.info(f"Successfully connected to {self.db_name} database")
 
+    def attach_index(self, index) -> None:
+        """
+            Keeps <index> up to date with the offers inserted by add_offers_clean.
+        """
+
+        self.index = index
+
+    def attach_embedding_cache(self, embedding_cache) -> None:
+        """
+            Makes add_offers_clean look embeddings up in <embedding_cache> before encoding.
+        """
+
+        self.embedding_cache = embedding_cache
+
+    def open_connection(self) -> Connection:
+        """
+            Opens another connection to the database, usable from any thread,
+            for work that runs next to the main connection (e.g. a pipeline stage).
+        """
+
+        connection = sqlite3.connect(self.db_name, check_same_thread=False)
+        self.set_journal_mode(connection)
+        return connection
+
+    def set_journal_mode(self, connection: Connection) -> None:
+        """
+            Opt-in (DB_WAL=1) write-ahead logging: readers no longer block the writer
+            and commits only fsync at checkpoints with synchronous=NORMAL.
+        """
+
+        if self.wal:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+
+    def optimize(self) -> None:
+        """
+            Refreshes the query planner statistics that need it and, in WAL mode,
+            folds the write-ahead log back into the database file.
+        """
+
+        try:
+            self.cursor.execute("PRAGMA optimize")
+            if self.wal:
+                self.cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except Exception as e:
+            logger.error(f"Failed to optimize {self.db_name}: {e}")
+
+    def get_sync_state(self, key: str, default=None):
+
+        row = self.cursor.execute(f"SELECT value FROM {self.sync_table} WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_sync_state(self, key: str, value) -> None:
+
+        self.cursor.execute(
+            f"INSERT INTO {self.sync_table} (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, str(value))
+        )
+        self.db_connection.commit()
+
+    def delete_sync_state(self, key: str) -> None:
+
+        self.cursor.execute(f"DELETE FROM {self.sync_table} WHERE key = ?", (key,))
+        self.db_connection.commit()
+
+    def add_vector_columns(self, table_name: str) -> None:
+        """
+            Adds the vector_model and vector_dim columns to an offers (or archive)
+            table created before vectors recorded their model. The existing
+            vectors, BLOBs or legacy JSON text, are tagged with DEFAULT_EMBED_MODEL,
+            the only model used until then; unreadable ones are left for the
+            backfill to re-embed.
+        """
+
+        schema, _, table = table_name.rpartition(".")
+        existing = {row[1] for row in self.cursor.execute(f"PRAGMA {schema or 'main'}.table_info({table})")}
+        if not existing or "vector_model" in existing:
+            return
+        with self.db_connection:
+            for name, data_type in self.VECTOR_COLUMNS:
+                if name not in existing:
+                    self.cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {name} {data_type}")
+            self.cursor.execute(
+                f"UPDATE {table_name} SET vector_model = ?, vector_dim = length(vector) / ? "
+                f"WHERE typeof(vector) = 'blob'",
+                (DEFAULT_EMBED_MODEL, np.dtype(self.vector_dtype).itemsize)
+            )
+            self.cursor.execute(
+                f"UPDATE {table_name} SET vector_model = ?, vector_dim = json_array_length(vector) "
+                f"WHERE typeof(vector) = 'text' AND json_valid(vector)",
+                (DEFAULT_EMBED_MODEL,)
+            )
+        logger.info(f"Added {', '.join(name for name, _ in self.VECTOR_COLUMNS)} columns to {table_name} table")
+
+    def add_thread_id_column(self) -> None:
+        """
+            Adds the thread_id column to an applications table created before
+            replies were matched on it. A sent message starts its own thread, so
+            the existing applications take their email id as thread id.
+        """
+
+        existing = {row[1] for row in self.cursor.execute(f"PRAGMA table_info({self.application_table})")}
+        if not existing or "thread_id" in existing:
+            return
+        with self.db_connection:
+            self.cursor.execute(f"ALTER TABLE {self.application_table} ADD COLUMN thread_id TEXT")
+            self.cursor.execute(f"UPDATE {self.application_table} SET thread_id = email_id")
+        logger.info(f"Added thread_id column to {self.application_table} table")
+
     def delete_table(self, table_name: str) -> None:
 
         try:
@@ -52,38 +216,149 @@ class DBManager:
         self.delete_table(self.offers_table)
         self.delete_table(self.application_table)
 
-    def get_internships(self) -> Iterator:
+    def internships_query(self, columns: str = "o.*") -> str:
 
-        query = f"""
-        SELECT o.*
+        return f"""
+        SELECT {columns}
             FROM {self.offers_table} o
             JOIN (
-                SELECT email, MAX(id) AS max_offer_id
-                FROM Offers
-                WHERE invalid_at > ?
-                AND NOT has_applied
-                AND email NOT IN (
-                    SELECT sent_to FROM {self.application_table}
+                SELECT p.email, MAX(p.id) AS max_offer_id
+                FROM {self.offers_table} p
+                WHERE p.invalid_at > ?
+                AND NOT p.has_applied
+                AND NOT EXISTS (
+                    SELECT 1 FROM {self.application_table} a WHERE a.sent_to = p.email
                 )
-                GROUP BY email
+                GROUP BY p.email
             ) latest
-            ON o.email = latest.email AND o.id = latest.max_offer_id;
+            ON o.id = latest.max_offer_id;
             """
+
+    def get_internships(self, record_type: Type[Record] = OfferContact, batch_size: int = 500) -> Iterator[Record]:
+        """
+            Streams the latest pending offer of every recruiter not contacted yet,
+            projected on <record_type>. The rows are read through their own cursor,
+            so applications can be recorded while iterating: the "latest" subquery
+            is materialized by SQLite before the first row is returned.
+            The query and fetch time is recorded under db_get_internships.
+        """
+
         now = datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
-        self.cursor.execute(query, (now,))
-        return self.cursor
+        start = time.perf_counter()
+        cursor = self.db_connection.execute(self.internships_query(record_type.columns("o")), (now,))
+        return iter_records(cursor, record_type, batch_size, "db_get_internships", time.perf_counter() - start)
 
-    def get_apprenticeships(self) -> Iterator:
+    def apprenticeships_query(self, columns: str = "*") -> str:
+
+        return f"SELECT {columns} FROM {self.offers_table} WHERE invalid_at > ? AND contract_type == 'apprenticeship' AND NOT has_applied"
+
+    def get_apprenticeships(self, record_type: Type[Record] = OfferContact, batch_size: int = 500) -> Iterator[Record]:
+
+        now = datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+        start = time.perf_counter()
+        cursor = self.db_connection.execute(self.apprenticeships_query(record_type.columns()), (now,))
+        return iter_records(cursor, record_type, batch_size, "db_get_apprenticeships", time.perf_counter() - start)
+
+    def explain(self, query: str, params: Tuple = ()) -> List[str]:
+        """
+            Returns the EXPLAIN QUERY PLAN details of <query>, one line per step.
+        """
+
+        return [row[3] for row in self.cursor.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()]
+
+    def find_full_scans(self) -> dict[str, List[str]]:
+        """
+            Runs EXPLAIN QUERY PLAN on the hot read queries and returns, for each
+            query that scans a table without any index, the offending plan steps.
+        """
 
         now = datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
-        self.cursor.execute(f"SELECT * FROM {self.offers_table} WHERE invalid_at > ? AND contract_type == 'apprenticeship' AND NOT has_applied", (now,))
-        return self.cursor
+        full_scans = {}
+        for name, query in (
+            ("internships", self.internships_query(OfferContact.columns("o"))),
+            ("apprenticeships", self.apprenticeships_query(OfferContact.columns())),
+        ):
+            plan = self.explain(query, (now,))
+            subqueries = {step.split()[-1] for step in plan if step.startswith(("MATERIALIZE", "CO-ROUTINE"))}
+            scans = [
+                step for step in plan
+                if step.startswith("SCAN ") and "USING" not in step and step.split()[1] not in subqueries
+            ]
+            if scans:
+                full_scans[name] = scans
+        return full_scans
 
     def validate_application(self, offer_id: int):
 
         self.cursor.execute(f"UPDATE {self.offers_table} SET has_applied = 1 WHERE id = ?", (offer_id,))
         self.db_connection.commit()
 
+    @timed("db_record_applications")
+    def record_applications(self, applications: List[Tuple], columns: List[Tuple[str,str]]) -> int:
+        """
+            Marks the offers of <applications> as applied, in a transaction of its
+            own so that a sent email is never sent again, then registers the
+            applications. A batch with a bad application is registered one
+            application at a time, skipping only the failing ones.
+            The offer id is expected to be the last value of each application.
+            Returns the number of registered applications.
+        """
+
+        if not applications:
+            return 0
+        query = f"""INSERT INTO {self.application_table} ({', '.join([item[0] for item in columns])})
+            VALUES ({', '.join('?' * len(columns))})"""
+        try:
+            with self.db_connection:
+                self.cursor.executemany(
+                    f"UPDATE {self.offers_table} SET has_applied = 1 WHERE id = ?",
+                    [(application[-1],) for application in applications]
+                )
+        except Exception as e:
+            logger.error(f"Failed to mark {len(applications)} offer(s) as applied: {e}.")
+            raise
+        try:
+            with self.db_connection:
+                self.cursor.executemany(query, applications)
+            logger.info(f"Successfully registered {len(applications)} application(s) to {self.application_table} table.")
+            return len(applications)
+        except Exception as e:
+            logger.error(f"Failed to register {len(applications)} application(s) at once, retrying one by one: {e}.")
+        registered = 0
+        for application in applications:
+            try:
+                with self.db_connection:
+                    self.cursor.execute(query, application)
+                registered += 1
+            except Exception as e:
+                logger.error(f"Failed to register the application to offer {application[-1]}: {e}.")
+        logger.info(f"Registered {registered}/{len(applications)} application(s) to {self.application_table} table.")
+        return registered
+
+    def record_responses(self, thread_ids: Iterable[str], response_date: str, chunk_size: int = 500) -> int:
+        """
+            Flags the applications whose email thread is one of <thread_ids> as
+            answered on <response_date>, in a single transaction.
+            Applications already flagged keep their first response date.
+            Returns the number of newly answered applications.
+        """
+
+        thread_ids = list(thread_ids)
+        answered = 0
+        try:
+            with self.db_connection:
+                for i in range(0, len(thread_ids), chunk_size):
+                    chunk = thread_ids[i:i + chunk_size]
+                    answered += self.cursor.execute(
+                        f"UPDATE {self.application_table} SET got_response = 1, response_date = ? "
+                        f"WHERE NOT got_response AND thread_id IN ({','.join(['?'] * len(chunk))})",
+                        [response_date, *chunk]
+                    ).rowcount
+        except Exception as e:
+            logger.error(f"Failed to record responses to {self.application_table} table: {e}")
+            raise
+        return answered
+
     def validate_many_applications(self, offer_ids: list):
 
         self.cursor.executemany(f"UPDATE {self.offers_table} SET has_applied = 1 WHERE id = ?", offer_ids)
@@ -94,14 +369,82 @@ class DBManager:
         count = self.cursor.execute(f"SELECT COUNT(*) FROM {self.offers_table}").fetchone()[0]
         return count
 
-    def add_offers_clean(self, offers: list, model, columns = 18) -> int:
-
-        count_before = self.get_offers_count()
+    @timed("db_get_existing_offer_ids")
+    def get_existing_offer_ids(self, offer_ids: List[int], chunk_size: int = 500) -> set[int]:
+
+        existing = set()
+        tables = [self.offers_table, self.archive_table] if self.archive else [self.offers_table]
+        for i in range(0, len(offer_ids), chunk_size):
+            chunk = offer_ids[i:i + chunk_size]
+            placeholders = ','.join(['?'] * len(chunk))
+            rows = self.cursor.execute(
+                " UNION ALL ".join(f"SELECT id FROM {table} WHERE id IN ({placeholders})" for table in tables),
+                chunk * len(tables)
+            ).fetchall()
+            existing.update(row[0] for row in rows)
+        return existing
+
+    def filter_new_offers(self, offers: list) -> list:
+        """
+            Returns the offers of <offers> whose id is not in the database yet,
+            without duplicates.
+        """
+
+        existing = self.get_existing_offer_ids([int(offer['id']) for offer in offers])
+        new_offers = []
+        for offer in offers:
+            offer_id = int(offer['id'])
+            if offer_id not in existing:
+                existing.add(offer_id)
+                new_offers.append(offer)
+        return new_offers
+
+    @timed("db_get_offer_ids")
+    def get_offer_ids(self, above: int = None) -> set[int]:
+        """
+            Ids of every known offer (above <above> if given), archived ones included.
+        """
+
+        tables = [self.offers_table, self.archive_table] if self.archive else [self.offers_table]
+        where = "" if above is None else " WHERE id > ?"
+        params = () if above is None else (above,) * len(tables)
+        rows = self.cursor.execute(" UNION ALL ".join(f"SELECT id FROM {table}{where}" for table in tables), params).fetchall()
+        return {row[0] for row in rows}
+
+    @timed("langdetect")
+    def detect_languages(self, offers: list) -> List[str]:
+
+        return detect_languages([offer['little_description'] for offer in offers], self.langdetect_processes)
+
+    def add_offers_clean(self, offers: list, model, batch_size: int = 32) -> int:
+
+        offers = self.filter_new_offers(offers)
+        if not offers:
+            return 0
+        langs = self.detect_languages(offers)
+        vectors = encode_texts(model, [offer['big_description'] for offer in offers], batch_size, self.embedding_cache)
+        return self.insert_offers(offers, langs, vectors)
+
+    @timed("db_insert_offers")
+    def insert_offers(self, offers: list, langs: List[str], vectors: np.ndarray) -> int:
+        """
+            Inserts already enriched <offers> (detected languages and embeddings)
+            in a single transaction and returns the number of new rows.
+            Offers whose id already exists are skipped instead of failing the batch;
+            any other error rolls the batch back and is raised.
+            Vectors are recorded along with the model they come from (EMBED_MODEL).
+        """
+
+        if not offers:
+            return 0
+        columns = [name for name, _ in self.schema[self.offers_table]]
+        query = f"""INSERT INTO {self.offers_table} ({', '.join(columns)})
+            VALUES ({','.join(['?'] * len(columns))}) ON CONFLICT DO NOTHING RETURNING id"""
+        inserted = []
         try:
-            self.cursor.executemany(
-                f"INSERT INTO {self.offers_table} VALUES ({','.join(['?'] * columns)})",
-                [
-                    (
+            with self.db_connection:
+                for offer, lang, vector in zip(offers, langs, vectors):
+                    row = self.cursor.execute(query, (
                         int(offer['id']),
                         offer['title'],
                         offer['little_description'],
@@ -117,19 +460,62 @@ class DBManager:
                         offer['slug'],
                         offer['created_at'],
                         int(offer['company_id']),
-                        detect(offer['little_description']),
+                        lang,
                         int(0),
-                        get_vector_as_str(model, offer['big_description']),
-                    ) for offer in offers
+                        get_array_as_vector_blob(vector, self.vector_dtype),
+                        self.model_name,
+                        len(vector),
+                    )).fetchone()
+                    if row is not None:
+                        inserted.append(row[0])
+        except Exception as e:
+            logger.error(f"Failed to insert {len(offers)} offer(s): {e}")
+            raise
+        if self.index is not None and inserted:
+            positions = {offer_id: i for i, offer_id in enumerate(int(offer['id']) for offer in offers)}
+            self.index.add(inserted, vectors[[positions[offer_id] for offer_id in inserted]])
+        metrics.count("offers_inserted", len(inserted))
+        if inserted: logger.info(f"{len(inserted)} new offers added to database")
+        return len(inserted)
+
+    def get_stale_vectors(self, after_id: int, limit: int, full: bool = False) -> List[Tuple[int, str]]:
+        """
+            Returns the (id, big_description) of the next <limit> offers after
+            <after_id> whose vector was not produced by EMBED_MODEL (all of them
+            with <full>), in id order.
+        """
+
+        stale = "" if full else " AND (vector IS NULL OR vector_model IS NOT ?)"
+        params = (after_id, limit) if full else (after_id, self.model_name, limit)
+        return self.cursor.execute(
+            f"SELECT id, big_description FROM {self.offers_table} WHERE id > ?{stale} ORDER BY id LIMIT ?", params
+        ).fetchall()
+
+    @timed("db_update_vectors")
+    def update_vectors(self, offer_ids: List[int], vectors: np.ndarray, checkpoint_key: str = None) -> None:
+        """
+            Replaces the vectors of <offer_ids> by <vectors>, produced by EMBED_MODEL,
+            and records the last id under <checkpoint_key>, in a single transaction.
+            The attached embedding index, when it holds EMBED_MODEL vectors, is
+            updated as well.
+        """
+
+        with self.db_connection:
+            self.cursor.executemany(
+                f"UPDATE {self.offers_table} SET vector = ?, vector_model = ?, vector_dim = ? WHERE id = ?",
+                [
+                    (get_array_as_vector_blob(vector, self.vector_dtype), self.model_name, len(vector), offer_id)
+                    for offer_id, vector in zip(offer_ids, vectors)
                 ]
             )
-            self.db_connection.commit()
-        except Exception as e:
-            logger.error(f"An error occured: {e}")
-        count_after = self.get_offers_count()
-        added_offers_count = count_after - count_before
-        if added_offers_count: logger.info(f"{added_offers_count} new offers added to database")
-        return added_offers_count
+            if checkpoint_key is not None:
+                self.cursor.execute(
+                    f"INSERT INTO {self.sync_table} (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (checkpoint_key, str(offer_ids[-1]))
+                )
+        if self.index is not None and self.index.model in (None, self.model_name):
+            self.index.remove(offer_ids)
+            self.index.add(offer_ids, vectors)
 
     def delete_offer_by_email(self, email: str):
 
@@ -147,10 +533,161 @@ class DBManager:
             logger.info(f"Successfully created {table_name} table")
         except Exception as e:
             logger.error(f"Failed to create {table_name} table: {e}")
+        self.create_indexes(table_name, self.indexes.get(table_name, []))
+
+    def create_fts_table(self) -> bool:
+        """
+            Creates the FTS5 index over the title and descriptions of the offers
+            (an external content table, so the text is not stored twice) and
+            fills it when the offers table already holds rows.
+            Triggers keep it in sync with every insert, delete and update of
+            the indexed columns of the offers table.
+            Returns False when this SQLite build has no FTS5 support.
+        """
+
+        columns = "title, little_description, big_description"
+        new_values = "new.id, new.title, new.little_description, new.big_description"
+        old_values = "'delete', old.id, old.title, old.little_description, old.big_description"
+        try:
+            exists = self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (self.fts_table,)).fetchone()
+            self.cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts_table} USING fts5("
+                f"{columns}, content='{self.offers_table}', content_rowid='id')"
+            )
+            self.cursor.executescript(f"""
+                CREATE TRIGGER IF NOT EXISTS {self.fts_table}_insert AFTER INSERT ON {self.offers_table} BEGIN
+                    INSERT INTO {self.fts_table}(rowid, {columns}) VALUES ({new_values});
+                END;
+                CREATE TRIGGER IF NOT EXISTS {self.fts_table}_delete AFTER DELETE ON {self.offers_table} BEGIN
+                    INSERT INTO {self.fts_table}({self.fts_table}, rowid, {columns}) VALUES ({old_values});
+                END;
+                CREATE TRIGGER IF NOT EXISTS {self.fts_table}_update AFTER UPDATE OF {columns} ON {self.offers_table} BEGIN
+                    INSERT INTO {self.fts_table}({self.fts_table}, rowid, {columns}) VALUES ({old_values});
+                    INSERT INTO {self.fts_table}(rowid, {columns}) VALUES ({new_values});
+                END;
+            """)
+            if not exists:
+                self.cursor.execute(f"INSERT INTO {self.fts_table}({self.fts_table}) VALUES('rebuild')")
+                logger.info(f"Successfully created {self.fts_table} full-text index")
+            self.db_connection.commit()
+            self.fts = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Full-text search disabled, couldn't create {self.fts_table}: {e}")
+            self.fts = False
+        return self.fts
+
+    def create_archive_table(self) -> None:
+        """
+            Creates the archive table, with the columns of the offers table, in
+            the main database or in the DB_ARCHIVE_NAME database when one is set.
+        """
+
+        columns_def = ', '.join([f"{name} {data_type}" for name, data_type in self.schema[self.offers_table]])
+        self.cursor.execute(f"CREATE TABLE IF NOT EXISTS {self.archive_table} ({columns_def});")
+        self.db_connection.commit()
+        self.archive = True
+
+    @timed("db_archive")
+    def archive_expired_offers(self, drop_vectors: bool = False, batch_size: int = 5000) -> List[int]:
+        """
+            Moves the expired offers that were never applied to into the archive
+            table, <batch_size> offers per transaction (the full-text index
+            triggers remove them from the index). <drop_vectors> archives them without their vector and
+            big description. Archived ids still count as known offers, so they are
+            never downloaded again. Returns the archived ids.
+        """
+
+        if not self.archive:
+            self.create_archive_table()
+        now = datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+        columns = [name for name, _ in self.schema[self.offers_table]]
+        dropped = ("big_description", "vector", "vector_model", "vector_dim") if drop_vectors else ()
+        projection = ', '.join("NULL" if name in dropped else name for name in columns)
+        archived = []
+        while True:
+            ids = [row[0] for row in self.cursor.execute(
+                f"SELECT id FROM {self.offers_table} WHERE invalid_at <= ? AND NOT has_applied LIMIT ?", (now, batch_size)
+            ).fetchall()]
+            if not ids:
+                break
+            placeholders = ','.join(['?'] * len(ids))
+            try:
+                with self.db_connection:
+                    self.cursor.execute(
+                        f"INSERT OR REPLACE INTO {self.archive_table} ({', '.join(columns)}) "
+                        f"SELECT {projection} FROM {self.offers_table} WHERE id IN ({placeholders})",
+                        ids
+                    )
+                    self.cursor.execute(f"DELETE FROM {self.offers_table} WHERE id IN ({placeholders})", ids)
+            except Exception as e:
+                logger.error(f"Failed to archive {len(ids)} offer(s): {e}")
+                break
+            archived += ids
+        if self.index is not None and archived:
+            self.index.remove(archived)
+        metrics.count("offers_archived", len(archived))
+        if archived: logger.info(f"{len(archived)} expired offer(s) moved to {self.archive_table} table")
+        return archived
+
+    def compact(self, pages: int = None) -> None:
+        """
+            Gives the free pages left by deleted rows back to the file system,
+            <pages> at most, and refreshes the planner statistics.
+            The first call switches the database to incremental auto-vacuum,
+            which takes one full VACUUM.
+        """
+
+        try:
+            self.db_connection.commit()
+            if self.cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                logger.info(f"Switching {self.db_name} to incremental auto-vacuum, running a full VACUUM once")
+                self.cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                self.cursor.execute("VACUUM")
+            elif pages is None:
+                self.cursor.execute("PRAGMA incremental_vacuum").fetchall()
+            else:
+                self.cursor.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+            self.cursor.execute("ANALYZE")
+            self.db_connection.commit()
+        except Exception as e:
+            logger.error(f"Failed to compact {self.db_name}: {e}")
+
+    def get_table_size(self, table_name: str) -> Tuple[int, Optional[int]]:
+        """
+            Returns the number of rows of <table_name> and, when SQLite was built
+            with the dbstat table, the bytes used by the table and its indexes.
+        """
+
+        rows = self.cursor.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        try:
+            size = self.cursor.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = ? OR name IN (SELECT name FROM sqlite_master WHERE tbl_name = ?)",
+                (table_name, table_name)
+            ).fetchone()[0]
+        except sqlite3.OperationalError:
+            size = None
+        return rows, size
+
+    def create_indexes(self, table_name: str, indexes: list[dict]):
+        """
+            Creates the <indexes> declared for <table_name> in the schema file.
+            Each index is a dict with a "name", its "columns", and optionally
+            "unique": true and a "where" clause for partial indexes.
+        """
+
+        for index in indexes:
+            unique = "UNIQUE " if index.get("unique") else ""
+            where = f" WHERE {index['where']}" if index.get("where") else ""
+            try:
+                self.cursor.execute(
+                    f"CREATE {unique}INDEX IF NOT EXISTS {index['name']} ON {table_name} ({', '.join(index['columns'])}){where};"
+                )
+            except Exception as e:
+                logger.error(f"Failed to create {index.get('name')} index on {table_name} table: {e}")
 
     def get_applications_count(self):
 
-        return self.cursor.execute(f"COUNT(*) FROM {self.application_table}").fetchone()[0]
+        return self.cursor.execute(f"SELECT COUNT(*) FROM {self.application_table}").fetchone()[0]
 
     def get_all_applications(self):
 
@@ -168,6 +705,7 @@ class DBManager:
             logger.error(f"Failed to register application {application[3]} to {self.application_table} table: {e}.")
             raise
 
-    def get_vector_by_id(self, id: int) -> List[float]:
+    def get_vector_by_id(self, id: int) -> np.ndarray:
 
-        return self.cursor.execute(f'SELECT vector FROM {self.offers_table} WHERE id = {id}').fetchone()[0]
+        vector = self.cursor.execute(f'SELECT vector FROM {self.offers_table} WHERE id = ?', (id,)).fetchone()[0]
+        return get_vector_as_array(vector, self.vector_dtype)
@@ -0,0 +1,152 @@
+from sqlite3 import Connection
+from typing import List
+import hashlib
+import re
+import time
+import unicodedata
+import numpy as np
+from utils.vectorize import get_array_as_vector_blob, get_vector_blob_as_array
+from utils.metrics import metrics
+from loguru import logger
+
+class EmbeddingCache:
+    """
+        Persistent embedding cache keyed by (model name, hash of the normalized text).
+        It lives in its own table of the offers database, and the least recently
+        used entries are evicted once it holds more than <max_entries> vectors.
+        Lookups don't write: the use times of the entries they hit are buffered,
+        and written along with the next put_many, or by flush().
+    """
+
+    db_connection: Connection
+    model_name: str
+    table: str
+    max_entries: int
+    hits: int
+    misses: int
+    touched: dict[str, int]
+
+    #flush the buffered use times past this many entries
+    MAX_TOUCHED = 10000
+
+    def __init__(self, db_connection: Connection, model_name: str, max_entries: int = 100000, table: str = "EmbeddingCache"):
+
+        self.db_connection = db_connection
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self.touched = {}
+        self.db_connection.execute(
+            f"""CREATE TABLE IF NOT EXISTS {self.table} (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )"""
+        )
+        self.db_connection.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_last_used ON {self.table} (last_used)")
+        self.db_connection.commit()
+
+    def encode(self, model, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """
+            Returns the (n, dim) float32 embeddings of <texts>, only running <model>
+            on the texts that are not cached yet, in one batched call.
+        """
+
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        hashes = [hash_text(text) for text in texts]
+        cached = self.get_many(hashes)
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in cached:
+                missing.setdefault(text_hash, text)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        metrics.count("embedding_cache_hits", len(texts) - len(missing))
+        metrics.count("embedding_cache_misses", len(missing))
+        if missing:
+            with metrics.timer("model_encode"):
+                vectors = np.asarray(model.encode(list(missing.values()), batch_size=batch_size), dtype=np.float32)
+            computed = dict(zip(missing.keys(), vectors))
+            self.put_many(computed)
+            cached.update(computed)
+        return np.stack([cached[text_hash] for text_hash in hashes])
+
+    def get_many(self, hashes: List[str], chunk_size: int = 500) -> dict[str, np.ndarray]:
+
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        for i in range(0, len(unique), chunk_size):
+            chunk = unique[i:i + chunk_size]
+            rows = self.db_connection.execute(
+                f"SELECT text_hash, vector FROM {self.table} WHERE model = ? AND text_hash IN ({','.join(['?'] * len(chunk))})",
+                [self.model_name, *chunk]
+            ).fetchall()
+            found.update((text_hash, get_vector_blob_as_array(vector)) for text_hash, vector in rows)
+        if found:
+            now = time.time_ns()
+            self.touched.update((text_hash, now) for text_hash in found)
+            if len(self.touched) >= self.MAX_TOUCHED:
+                self.flush()
+        return found
+
+    def put_many(self, vectors: dict[str, np.ndarray]) -> None:
+
+        now = time.time_ns()
+        self.db_connection.executemany(
+            f"INSERT OR REPLACE INTO {self.table} (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+            [(self.model_name, text_hash, get_array_as_vector_blob(vector), now) for text_hash, vector in vectors.items()]
+        )
+        self.write_touched()
+        self.evict()
+        self.db_connection.commit()
+
+    def flush(self) -> None:
+        """
+            Writes the buffered use times.
+        """
+
+        if self.touched:
+            self.write_touched()
+            self.db_connection.commit()
+
+    def write_touched(self) -> None:
+
+        touched, self.touched = self.touched, {}
+        self.db_connection.executemany(
+            f"UPDATE {self.table} SET last_used = ? WHERE model = ? AND text_hash = ?",
+            [(last_used, self.model_name, text_hash) for text_hash, last_used in touched.items()]
+        )
+
+    def evict(self) -> int:
+        """
+            Removes the least recently used entries above <max_entries>.
+        """
+
+        count = self.db_connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow <= 0:
+            return 0
+        self.db_connection.execute(
+            f"DELETE FROM {self.table} WHERE rowid IN (SELECT rowid FROM {self.table} ORDER BY last_used LIMIT ?)",
+            (overflow,)
+        )
+        return overflow
+
+    def log_stats(self) -> None:
+
+        total = self.hits + self.misses
+        if total:
+            logger.info(f"Embedding cache: {self.hits} hit(s), {self.misses} miss(es) ({100 * self.hits / total:.1f}% hit rate)")
+
+def normalize_text(text: str) -> str:
+
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text or "")).strip()
+
+def hash_text(text: str) -> str:
+
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
@@ -0,0 +1,100 @@
+from sqlite3 import Cursor
+from typing import Iterator, Sequence, Type, TypeVar
+import time
+from utils.metrics import metrics
+
+Record = TypeVar("Record", bound="OfferRecord")
+
+class OfferRecord:
+    """
+        Typed, lightweight view over a projection of an Offers row.
+        Each subclass lists the columns it needs in __slots__, which is also
+        what its queries select, so rows never carry unused columns such as
+        big_description or vector.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, *values):
+
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def columns(cls, alias: str = None) -> str:
+        """
+            The projection of this record, as a SELECT list.
+        """
+
+        prefix = f"{alias}." if alias else ""
+        return ", ".join(f"{prefix}{name}" for name in cls.__slots__)
+
+    @classmethod
+    def from_row(cls: Type[Record], row: Sequence) -> Record:
+
+        return cls(*row)
+
+    def as_tuple(self) -> tuple:
+
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other) -> bool:
+
+        return type(self) is type(other) and self.as_tuple() == other.as_tuple()
+
+    def __repr__(self) -> str:
+
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+class OfferContact(OfferRecord):
+    """
+        What an application email needs.
+    """
+
+    __slots__ = ("id", "title", "email", "lang")
+
+    id: int
+    title: str
+    email: str
+    lang: str
+
+class OfferSummary(OfferRecord):
+    """
+        What search results display.
+    """
+
+    __slots__ = ("id", "title", "contract_type", "email", "company_id", "lang", "invalid_at", "has_applied")
+
+    id: int
+    title: str
+    contract_type: str
+    email: str
+    company_id: int
+    lang: str
+    invalid_at: str
+    has_applied: int
+
+def iter_records(cursor: Cursor, record_type: Type[Record], batch_size: int = 500, metric: str = None,
+                 elapsed: float = 0.0) -> Iterator[Record]:
+    """
+        Streams the rows of an executed <cursor> as <record_type> records,
+        <batch_size> rows at a time, without materializing the result set.
+        With <metric>, the time spent in SQLite (<elapsed> seconds to execute the
+        query, plus every fetch, but not the time spent by the caller between
+        records) is recorded under it once the records are exhausted or the
+        iterator is closed.
+    """
+
+    try:
+        while True:
+            start = time.perf_counter()
+            rows = cursor.fetchmany(batch_size)
+            elapsed += time.perf_counter() - start
+            if not rows:
+                break
+            for row in rows:
+                yield record_type(*row)
+    finally:
+        if metric is not None:
+            metrics.observe(metric, elapsed)
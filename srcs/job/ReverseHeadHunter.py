@@ -1,7 +1,16 @@
-from typing import Iterator, Dict, Any
+from typing import Iterator, Dict, Any, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import threading
 import time
 from oauthlib.oauth2.rfc6749.clients.backend_application import BackendApplicationClient
+from requests import Response
+from requests.adapters import HTTPAdapter
 from requests_oauthlib.oauth2_session import OAuth2Session
+from urllib3.util.retry import Retry
+from utils.rate_limit import TokenBucket
+from utils.metrics import metrics, timed
 from loguru import logger
 
 class ReverseHeadHunter:
@@ -9,20 +18,87 @@ class ReverseHeadHunter:
     client: BackendApplicationClient
     oauth: OAuth2Session
     token: Any
+    rate_limiter: TokenBucket
+    workers: int
+    timeout: float
+    token_url: str
+    client_id: str
+    client_secret: str
+
+    #refresh the token this many seconds before it expires
+    TOKEN_EXPIRY_MARGIN = 60
 
     def __init__(self, config: dict):
         self.client = BackendApplicationClient(client_id=config["RH_CLIENT_ID"])
         self.oauth = OAuth2Session(client=self.client)
-        self.token = self.oauth.fetch_token(
-            token_url=config["RH_TOKEN_URL"],
-            client_id=config["RH_CLIENT_ID"],
-            client_secret=config["RH_CLIENT_SECRET"]
+        self.workers = int(config.get("RH_WORKERS", 4))
+        self.timeout = float(config.get("RH_TIMEOUT", 30))
+        self.rate_limiter = TokenBucket(float(config.get("RH_RATE_LIMIT", 1)))
+        retries = Retry(
+            total=int(config.get("RH_MAX_RETRIES", 5)),
+            backoff_factor=float(config.get("RH_RETRY_BACKOFF", 0.5)),
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+            respect_retry_after_header=True,
+            raise_on_status=False,
         )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers, max_retries=retries)
+        self.oauth.mount("https://", adapter)
+        self.oauth.mount("http://", adapter)
+        self.token_url = config["RH_TOKEN_URL"]
+        self.client_id = config["RH_CLIENT_ID"]
+        self.client_secret = config["RH_CLIENT_SECRET"]
+        self.token_lock = threading.Lock()
+        self.token = None
+        self.refresh_token()
+
+    def refresh_token(self, expired: Any = None) -> Any:
+        """
+            Fetches a new client-credentials token. When <expired> is given, the
+            token is only fetched if no other thread replaced it in the meantime.
+        """
+
+        with self.token_lock:
+            if expired is None or self.token is expired:
+                self.token = self.oauth.fetch_token(
+                    token_url=self.token_url,
+                    client_id=self.client_id,
+                    client_secret=self.client_secret
+                )
+                metrics.count("rh_token_fetches")
+            return self.token
+
+    def token_expired(self) -> bool:
+
+        expires_at = (self.token or {}).get("expires_at")
+        return expires_at is not None and time.time() > expires_at - self.TOKEN_EXPIRY_MARGIN
+
+    @timed("rh_request")
+    def get(self, url: str) -> Response:
+        """
+            Rate-limited GET over the pooled, keep-alive session.
+            429 and 5xx responses are retried with exponential backoff.
+            The token is reused until it expires, and refreshed once on a 401.
+        """
+
+        token = self.token
+        if self.token_expired():
+            token = self.refresh_token(token)
+        metrics.observe("rh_rate_limit_wait", self.rate_limiter.acquire())
+        metrics.count("rh_requests")
+        response = self.oauth.get(url, timeout=self.timeout)
+        if response.status_code == 401:
+            logger.info("Job API token rejected, fetching a new one")
+            self.refresh_token(token)
+            metrics.observe("rh_rate_limit_wait", self.rate_limiter.acquire())
+            metrics.count("rh_requests")
+            response = self.oauth.get(url, timeout=self.timeout)
+        return response
 
     def fetch_offer_by_id(self, offers_url: str, offer_id: int) -> dict:
 
         url = offers_url + "/" + str(offer_id)
-        response = self.oauth.get(url)
+        response = self.get(url)
         #use of response.raise_for_status() would be better
         if response.status_code != 200:
             print(f"Error GET: {url}")
@@ -30,19 +106,52 @@ class ReverseHeadHunter:
 
     def fetch_offers_by_range(self, offers_url: str, start_page: int, end_page: int) -> Iterator[dict]:
 
-        page_query = "?page="
-        for page in range(start_page, end_page + 1):
-            url = offers_url + page_query + str(page)
-            response = self.oauth.get(url)
-            if (response.status_code != 200):
-                print(f"Error GET: {url}")
-                continue
-            time.sleep(1)
-            yield response.json()
+        for page in self.fetch_pages_concurrently(offers_url, start_page, end_page):
+            if page is not None:
+                yield page
 
     def fetch_offers_by_page(self, offers_url: str, page_id: int):
 
         page_query = "?page="
         url = offers_url + page_query + str(page_id)
-        response = self.oauth.get(url)
+        response = self.get(url)
         return response.json()
+
+    def fetch_page_or_none(self, offers_url: str, page_id: int) -> Optional[Any]:
+
+        url = offers_url + "?page=" + str(page_id)
+        try:
+            response = self.get(url)
+        except Exception as e:
+            metrics.count("rh_request_errors")
+            logger.error(f"Error GET: {url}: {e}")
+            return None
+        if response.status_code != 200:
+            metrics.count("rh_request_errors")
+            logger.error(f"Error GET: {url}: {response.status_code}")
+            return None
+        return response.json()
+
+    def fetch_pages_concurrently(self, offers_url: str, start_page: int = 1, end_page: int = None, workers: int = None) -> Iterator[Optional[Any]]:
+        """
+            Fetches pages <start_page>..<end_page> (endlessly when <end_page> is None)
+            with a bounded thread pool, and yields them in page order.
+            Pages that could not be fetched are yielded as None.
+            Closing the iterator cancels the requests that are still pending.
+        """
+
+        workers = workers or self.workers
+        pages = itertools.count(start_page) if end_page is None else iter(range(start_page, end_page + 1))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rh-fetch")
+        in_flight = deque()
+        try:
+            for page in itertools.islice(pages, workers):
+                in_flight.append(executor.submit(self.fetch_page_or_none, offers_url, page))
+            while in_flight:
+                result = in_flight.popleft().result()
+                next_page = next(pages, None)
+                if next_page is not None:
+                    in_flight.append(executor.submit(self.fetch_page_or_none, offers_url, next_page))
+                yield result
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,15 +1,18 @@
 import base64
 import os.path
-import mimetypes
-from utils.helpers import get_file_content, load_json_data
+from utils.helpers import load_json_data
+from db.OfferRecord import OfferContact
+from mailing.TemplateCache import TemplateCache
 from email.message import EmailMessage
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import google.auth
 from googleapiclient.discovery import Resource, build
 from googleapiclient.errors import HttpError
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
+from utils.rate_limit import TokenBucket
+from utils.metrics import metrics, timed
 from loguru import logger
 
 class DeliveryMachine:
@@ -25,19 +28,39 @@ class DeliveryMachine:
     email_template: str
     scopes: List[str]
     sender: str
+    batch_size: int
+    quota: TokenBucket
+    templates: TemplateCache
+    profiles: Dict[str, Dict]
 
-    def __init__(self, config: Dict):
+    #Gmail API quota units per call
+    SEND_COST = 100
+    DRAFT_COST = 10
+    BATCH_MODIFY_COST = 50
+    HISTORY_COST = 2
+    PROFILE_COST = 1
 
-        self.scopes = load_json_data(config["DM_GMAIL_SCOPES"])["SCOPES"]
-        self.set_credentials(config)
+    def __init__(self, config: Dict, service: Any = None):
+
+        if service is None:
+            self.scopes = load_json_data(config["DM_GMAIL_SCOPES"])["SCOPES"]
+            self.set_credentials(config)
         self.client_id = config["DM_CLIENT_ID"]
         self.client_secret = config["DM_CLIENT_SECRET"]
         self.sender = config["DM_SENDER"]
         self.auth_uri = config["DM_AUTH_URI"]
         self.token_uri = config["DM_TOKEN_URI"]
         self.gmail_base_uri = config["DM_GMAIL_BASE_URI"]
-        self.service = build("gmail", "v1", credentials=self.creds)
+        self.service = service if service is not None else build("gmail", "v1", credentials=self.creds)
+        self.batch_size = min(int(config.get("DM_BATCH_SIZE", 50)), 100)
+        quota_rate = float(config.get("DM_QUOTA_UNITS_PER_SECOND", 250))
+        self.quota = TokenBucket(quota_rate, max(quota_rate, self.SEND_COST))
         self.email_template = config["DM_EMAIL_TEMPLATE"]
+        self.templates = TemplateCache()
+        #optional {name: {"query", "template", "attachment"}} profiles, see create_email
+        self.profiles = {}
+        if config.get("DM_PROFILES"):
+            self.profiles = load_json_data(config["DM_PROFILES"]) or {}
         self.label_name = config["DM_LABEL_NAME"]
         self.label_id = self.get_or_create_label(self.label_name)
 
@@ -60,6 +83,7 @@ class DeliveryMachine:
             with open(token_file, "w") as token:
                 token.write(self.creds.to_json())
 
+    @timed("gmail_send")
     def send_email(self, message: EmailMessage) -> Dict:
 
         if message is not None:
@@ -85,30 +109,113 @@ class DeliveryMachine:
                 send_message = None
         return send_message
 
-    def create_email(self, offer: Tuple, attachment=None) -> EmailMessage:
+    def send_many(self, messages: List[EmailMessage]) -> List[Optional[Dict]]:
+        """
+            Sends <messages> through Gmail batch requests, then labels every sent
+            message with a single batchModify call per batch.
+            Returns, for each message, the sent message resource or None on failure.
+        """
+
+        return self.run_batched(
+            messages,
+            lambda raw: self.service.users().messages().send(userId="me", body={"raw": raw}),
+            lambda sent: sent["id"],
+            self.SEND_COST,
+        )
+
+    def create_drafts_many(self, messages: List[EmailMessage]) -> List[Optional[Dict]]:
+        """
+            Same as send_many, but creates drafts.
+        """
+
+        return self.run_batched(
+            messages,
+            lambda raw: self.service.users().drafts().create(userId="me", body={"message": {"raw": raw}}),
+            lambda draft: draft["message"]["id"],
+            self.DRAFT_COST,
+        )
+
+    def run_batched(self, messages: List[EmailMessage], make_request: Callable, get_message_id: Callable, cost: int) -> List[Optional[Dict]]:
+
+        results = [None] * len(messages)
+        for start in range(0, len(messages), self.batch_size):
+            chunk = range(start, min(start + self.batch_size, len(messages)))
+
+            def callback(request_id, response, exception):
+                if exception is not None:
+                    logger.error(f"Couldn't deliver mail {request_id}: {exception}")
+                else:
+                    results[int(request_id)] = response
+
+            batch = self.service.new_batch_http_request(callback=callback)
+            queued = 0
+            for i in chunk:
+                if messages[i] is None:
+                    continue
+                self.quota.acquire(cost)
+                raw = base64.urlsafe_b64encode(messages[i].as_bytes()).decode()
+                batch.add(make_request(raw), request_id=str(i))
+                queued += 1
+            if not queued:
+                continue
+            try:
+                with metrics.timer("gmail_batch"):
+                    batch.execute()
+            except HttpError as e:
+                metrics.count("gmail_batch_errors")
+                logger.error(f"Batch request failed: {e}")
+                continue
+            delivered = [get_message_id(results[i]) for i in chunk if results[i] is not None]
+            metrics.count("gmail_delivered", len(delivered))
+            metrics.count("gmail_failed", queued - len(delivered))
+            if self.label_id and delivered:
+                self.add_label(delivered)
+        return results
 
+    @timed("gmail_label")
+    def add_label(self, message_ids: List[str]) -> None:
+
+        try:
+            self.quota.acquire(self.BATCH_MODIFY_COST)
+            self.service.users().messages().batchModify(
+                userId="me",
+                body={"ids": message_ids, "addLabelIds": [self.label_id]}
+            ).execute()
+        except HttpError as e:
+            logger.error(f"Couldn't label {len(message_ids)} message(s): {e}")
+
+    @timed("email_build")
+    def create_email(self, offer: OfferContact, attachment=None, profile: str = None) -> EmailMessage:
+        """
+            Builds the application email for <offer>. When <profile> names one of
+            the configured profiles, its template and attachment are used instead
+            of the default ones.
+        """
+
+        template = self.email_template
+        if profile in self.profiles:
+            template = self.profiles[profile].get("template", template)
+            attachment = self.profiles[profile].get("attachment", attachment)
         if offer is not None:
             try:
-                lang = "en" if offer[15] != "fr" else "fr"
+                lang = "en" if offer.lang != "fr" else "fr"
                 email = EmailMessage()
-                email["To"] = offer[6]
+                email["To"] = offer.email
                 email["From"] = self.sender
-                email["Subject"] = f"RE: {offer[1]}"
+                email["Subject"] = f"RE: {offer.title}"
                 email.set_content(
                     "Application"
                 )
-                email.add_alternative(get_file_content(self.email_template.replace("xx", lang)), subtype = 'html')
+                email.add_alternative(self.templates.get_template(template.replace("xx", lang)), subtype = 'html')
                 if attachment is not None:
-                    type_subtype, _ = mimetypes.guess_type(attachment.replace("xx", lang))
-                    maintype, subtype = type_subtype.split("/")
-                    with open(attachment.replace("xx", lang), "rb") as fp:
-                        attachment_data = fp.read()
-                        email.add_attachment(attachment_data, maintype, subtype)
+                    email.make_mixed()
+                    email.attach(self.templates.get_attachment(attachment.replace("xx", lang)))
             except Exception as e:
                 logger.error(f"Couldn't create email: {e}")
                 email = None
         return email
 
+    @timed("gmail_create_draft")
     def create_draft(self, message: EmailMessage) -> Dict:
 
         if message is not None:
@@ -132,6 +239,53 @@ class DeliveryMachine:
                     draft = None
         return draft
 
+    def get_history_id(self) -> str:
+        """
+            The current history id of the mailbox, to track changes from.
+        """
+
+        self.quota.acquire(self.PROFILE_COST)
+        return self.service.users().getProfile(userId="me").execute()["historyId"]
+
+    @timed("gmail_history")
+    def fetch_replies(self, start_history_id: str) -> Tuple[set[str], Optional[str]]:
+        """
+            Returns the ids of the threads that received a message since
+            <start_history_id>, ignoring the messages sent or drafted from this
+            mailbox, and the history id to resume from next time.
+            The history id is None when <start_history_id> is too old to be
+            answered by Gmail: tracking must then restart from get_history_id().
+        """
+
+        thread_ids = set()
+        history_id = start_history_id
+        page_token = None
+        while True:
+            self.quota.acquire(self.HISTORY_COST)
+            try:
+                response = self.service.users().history().list(
+                    userId="me",
+                    startHistoryId=start_history_id,
+                    historyTypes=["messageAdded"],
+                    pageToken=page_token,
+                ).execute()
+            except HttpError as e:
+                if e.resp.status == 404:
+                    logger.warning(f"Gmail history {start_history_id} expired, replies received meanwhile are not tracked")
+                    return thread_ids, None
+                raise
+            for record in response.get("history", []):
+                for added in record.get("messagesAdded", []):
+                    message = added["message"]
+                    if not {"SENT", "DRAFT"} & set(message.get("labelIds", [])):
+                        thread_ids.add(message["threadId"])
+            history_id = response.get("historyId", history_id)
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+        metrics.count("gmail_reply_threads", len(thread_ids))
+        return thread_ids, history_id
+
     def get_label_id(self, label_name: str) -> str:
 
        labels = self.service.users().labels().list(userId="me").execute().get("labels", [])
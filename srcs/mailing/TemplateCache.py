@@ -0,0 +1,53 @@
+import mimetypes
+import os.path
+from email import policy
+from email.message import MIMEPart
+from typing import Any, Callable, Dict, Tuple
+from utils.helpers import get_file_content
+
+class TemplateCache:
+    """
+        Keeps the email templates and the prepared attachment MIME parts in memory.
+        Entries are keyed by file path and modification time, so a file edited
+        during a run is read again, but is otherwise read and encoded only once.
+    """
+
+    entries: Dict[Tuple[str, str], Tuple[float, Any]]
+
+    def __init__(self):
+
+        self.entries = {}
+
+    def get_template(self, path: str) -> str:
+
+        return self.get("template", path, get_file_content)
+
+    def get_attachment(self, path: str) -> MIMEPart:
+        """
+            Returns a base64-encoded attachment part, ready to be attached to an email.
+        """
+
+        return self.get("attachment", path, make_attachment_part)
+
+    def get(self, kind: str, path: str, load: Callable[[str], Any]) -> Any:
+
+        mtime = os.path.getmtime(path)
+        entry = self.entries.get((kind, path))
+        if entry is None or entry[0] != mtime:
+            entry = (mtime, load(path))
+            self.entries[(kind, path)] = entry
+        return entry[1]
+
+    def clear(self) -> None:
+
+        self.entries.clear()
+
+def make_attachment_part(path: str) -> MIMEPart:
+
+    type_subtype, _ = mimetypes.guess_type(path)
+    maintype, subtype = type_subtype.split("/")
+    with open(path, "rb") as fp:
+        attachment_data = fp.read()
+    part = MIMEPart(policy=policy.default)
+    part.set_content(attachment_data, maintype, subtype, disposition="attachment")
+    return part
@@ -1,10 +1,103 @@
+import time
+START = time.perf_counter()
+
+import argparse
 from schedule.Orchestrator import Orchestrator
+from loguru import logger
+
+#subsystems each command needs, and the startup time (imports + initialization)
+#it is expected to stay under, in seconds
+COMMANDS = {
+    "sync":   (("db", "hr", "model"), 15.0),
+    "send":   (("db", "dm"), 3.0),
+    "draft":  (("db", "dm"), 3.0),
+    "search": (("db", "model"), 12.0),
+    "replies": (("db", "dm"), 3.0),
+    "stats":  (("db",), 0.5),
+    "archive": (("db",), 0.5),
+    "backfill": (("db",), 0.5),
+    "daemon": ((), 1.0),
+}
+
+def parse_args() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description="Automated internship application engine.")
+    #kept from before the subcommands: same as "sync --full"
+    parser.add_argument("--full", dest="full_sync", action="store_true", help="deprecated alias of sync --full")
+    subparsers = parser.add_subparsers(dest="command")
+    sync = subparsers.add_parser("sync", help="download new offers")
+    sync.add_argument("--full", action="store_true", help="walk every page, ignoring the sync watermark, and store every missing offer")
+    subparsers.add_parser("send", help="send pending applications")
+    subparsers.add_parser("draft", help="create drafts for pending applications")
+    search = subparsers.add_parser("search", help="print the offers closest to a query")
+    search.add_argument("query")
+    search.add_argument("-k", type=int, default=10)
+    search.add_argument("--keywords", help="only rank offers matching this full-text query (FTS5 syntax)")
+    search.add_argument("--contract-type")
+    search.add_argument("--lang")
+    search.add_argument("--company-id", type=int)
+    search.add_argument("--all", action="store_true", help="include expired offers and offers already applied to")
+    subparsers.add_parser("replies", help="flag the applications that got a reply")
+    subparsers.add_parser("stats", help="print database statistics")
+    subparsers.add_parser("archive", help="archive expired offers and compact the database")
+    backfill = subparsers.add_parser("backfill", help="re-embed the offers whose vector comes from another model than EMBED_MODEL")
+    backfill.add_argument("--full", action="store_true", help="re-embed every offer, e.g. after a preprocessing change")
+    backfill.add_argument("--processes", type=int, help="worker processes (default: EMBED_BACKFILL_PROCESSES)")
+    subparsers.add_parser("daemon", help="keep running, syncing and sending on the DAEMON_* intervals")
+    return parser.parse_args()
+
+def check_startup(otr: Orchestrator, command: str) -> None:
+
+    subsystems, target = COMMANDS[command]
+    otr.warm_up(*subsystems)
+    elapsed = time.perf_counter() - START
+    if elapsed > target:
+        logger.warning(f"'{command}' startup took {elapsed:.2f}s (target: {target:.2f}s)")
+    else:
+        logger.info(f"'{command}' startup took {elapsed:.2f}s (target: {target:.2f}s)")
 
 def main():
+    args = parse_args()
     otr = Orchestrator()
-    otr.create_db_tables()
-    otr.download_offers()
-    otr.send_emails()
+    if args.command is None:
+        if args.full_sync:
+            logger.warning("--full without a command is deprecated, use 'sync --full' then 'send'")
+        otr.create_db_tables()
+        otr.download_offers(full=args.full_sync)
+        otr.send_emails()
+    else:
+        check_startup(otr, args.command)
+    if args.command == "sync":
+        otr.create_db_tables()
+        otr.download_offers(full=args.full or args.full_sync)
+    elif args.command == "send":
+        otr.send_emails()
+    elif args.command == "draft":
+        otr.create_drafts()
+    elif args.command == "search":
+        filters = {name: value for name, value in (
+            ("contract_type", args.contract_type), ("lang", args.lang), ("company_id", args.company_id)
+        ) if value is not None}
+        if args.all:
+            filters.update(valid_only=False, exclude_applied=False)
+        for offer in otr.search(args.query, args.k, args.keywords, **filters):
+            print(f"{offer.id}\t{offer.title}\t{offer.email}")
+    elif args.command == "replies":
+        otr.track_responses()
+    elif args.command == "stats":
+        for name, value in otr.get_stats().items():
+            print(f"{name}: {value}")
+    elif args.command == "archive":
+        report = otr.archive_offers()
+        for name in report["before"]:
+            print(f"{name}: {report['before'][name]} -> {report['after'][name]}")
+    elif args.command == "backfill":
+        otr.backfill_vectors(args.full, args.processes)
+    elif args.command == "daemon":
+        from schedule.Daemon import Daemon
+        Daemon(otr).run()
+        return
+    otr.report()
 
 if __name__ == '__main__':
     main()
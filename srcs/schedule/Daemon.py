@@ -0,0 +1,98 @@
+import random
+import signal
+import threading
+import time
+from typing import Callable, List
+from schedule.Orchestrator import Orchestrator
+from utils.metrics import metrics
+from loguru import logger
+
+class Job:
+
+    name: str
+    func: Callable[[], None]
+    interval: float
+    jitter: float
+    next_run: float
+
+    def __init__(self, name: str, func: Callable[[], None], interval: float, jitter: float = 0.1, delay: float = 0.0):
+
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.next_run = time.monotonic() + delay
+
+    def schedule_next(self) -> None:
+        """
+            Schedules the next run one <interval> from now, give or take <jitter>
+            (a fraction of the interval), so that runs don't align on the clock.
+        """
+
+        spread = self.interval * self.jitter
+        self.next_run = time.monotonic() + self.interval + random.uniform(-spread, spread)
+
+class Daemon:
+    """
+        Long-running scheduler: keeps one Orchestrator, and with it the embedding
+        model, the database connection, the job API token and the Gmail session,
+        and runs the sync, send, reply tracking and housekeeping jobs on their
+        own intervals.
+        SIGTERM and SIGINT stop it between two jobs, so that the job in progress
+        always completes and records its work.
+    """
+
+    otr: Orchestrator
+    jobs: List[Job]
+
+    def __init__(self, otr: Orchestrator):
+
+        self.otr = otr
+        self.stop = threading.Event()
+        conf = otr.conf
+        jitter = float(conf.get("DAEMON_JITTER", 0.1))
+        housekeeping_interval = float(conf.get("DAEMON_HOUSEKEEPING_INTERVAL", 86400))
+        self.jobs = [
+            Job("sync", self.otr.download_offers, float(conf.get("DAEMON_SYNC_INTERVAL", 3600)), jitter),
+            Job("send", self.otr.send_emails, float(conf.get("DAEMON_SEND_INTERVAL", 3600)), jitter),
+            Job("replies", self.otr.track_responses, float(conf.get("DAEMON_REPLIES_INTERVAL", 900)), jitter),
+            Job("housekeeping", self.otr.housekeeping, housekeeping_interval, jitter, delay=housekeeping_interval),
+        ]
+
+    def handle_signal(self, signum: int, frame) -> None:
+
+        logger.info(f"Received {signal.Signals(signum).name}, stopping after the current job")
+        self.stop.set()
+
+    def run(self) -> None:
+
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        signal.signal(signal.SIGINT, self.handle_signal)
+        logger.info(f"Warmed up in {self.otr.warm_up('db', 'hr', 'dm', 'model', 'embedding_cache'):.2f}s")
+        self.otr.create_db_tables()
+        while not self.stop.is_set():
+            job = min(self.jobs, key=lambda job: job.next_run)
+            if self.stop.wait(max(0.0, job.next_run - time.monotonic())):
+                break
+            self.run_job(job)
+        self.otr.report()
+        self.otr.db.db_connection.close()
+        logger.info("Daemon stopped")
+
+    def run_job(self, job: Job) -> None:
+        """
+            Runs <job> and schedules its next run. A failing job is logged and
+            retried on its next run instead of stopping the daemon.
+        """
+
+        start = time.perf_counter()
+        try:
+            job.func()
+            metrics.count(f"daemon_{job.name}_runs")
+        except Exception as e:
+            metrics.count(f"daemon_{job.name}_errors")
+            logger.error(f"{job.name} job failed: {e}")
+        finally:
+            job.schedule_next()
+        logger.info(f"{job.name} job took {time.perf_counter() - start:.2f}s")
+        self.otr.report()
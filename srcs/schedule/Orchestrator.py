@@ -1,98 +1,447 @@
-from typing import Dict, Tuple
+from functools import cached_property
+from itertools import islice
+import os.path
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple
 from db.DBManager import DBManager
-from job.ReverseHeadHunter import ReverseHeadHunter
-from mailing.DeliveryMachine import DeliveryMachine
+from db.OfferRecord import OfferContact
 from dotenv import load_dotenv, dotenv_values
+from schedule.Pipeline import Pipeline
 from utils.helpers import now_iso8601_utc
+from utils.metrics import metrics
+from utils.vectorize import DEFAULT_EMBED_MODEL, encode_texts
 from loguru import logger
-from sentence_transformers import SentenceTransformer
 import time
 
+if TYPE_CHECKING:
+    import numpy as np
+    from db.EmbeddingCache import EmbeddingCache
+    from job.ReverseHeadHunter import ReverseHeadHunter
+    from mailing.DeliveryMachine import DeliveryMachine
+    from search.EmbeddingIndex import EmbeddingIndex
+    from search.IVFIndex import IVFIndex
+    from sentence_transformers import SentenceTransformer
+
 class Orchestrator:
+    """
+        Every subsystem (database, job API client, Gmail client, embedding model)
+        and its heavy imports are only initialized on first use, so that each
+        command only pays for what it actually needs.
+    """
 
     def __init__(self):
 
         load_dotenv('.env')
         self.conf = dotenv_values('.env')
-        self.db = DBManager(self.conf)
-        self.hr = ReverseHeadHunter(self.conf)
-        self.dm = DeliveryMachine(self.conf)
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.model_name = self.conf.get("EMBED_MODEL", DEFAULT_EMBED_MODEL)
+        self.index = None
+        self.ann_index = None
         logger.add("logs/app.log", rotation="500 MB", level="INFO")
+        metrics.enable(self.conf.get("METRICS_ENABLED", "0") == "1")
+
+    @cached_property
+    def db(self) -> DBManager:
+
+        return DBManager(self.conf)
+
+    @cached_property
+    def hr(self) -> "ReverseHeadHunter":
+
+        from job.ReverseHeadHunter import ReverseHeadHunter
+        return ReverseHeadHunter(self.conf)
+
+    @cached_property
+    def dm(self) -> "DeliveryMachine":
+
+        from mailing.DeliveryMachine import DeliveryMachine
+        return DeliveryMachine(self.conf)
+
+    @cached_property
+    def model(self) -> "SentenceTransformer":
+
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(self.model_name)
+
+    @cached_property
+    def embedding_cache(self) -> "EmbeddingCache":
+
+        from db.EmbeddingCache import EmbeddingCache
+        embedding_cache = EmbeddingCache(
+            self.db.open_connection(),
+            self.model_name,
+            int(self.conf.get("EMBED_CACHE_SIZE", 100000))
+        )
+        self.db.attach_embedding_cache(embedding_cache)
+        return embedding_cache
+
+    @cached_property
+    def profile_vectors(self) -> "np.ndarray":
+        """
+            Embeddings of the "query" text of each DeliveryMachine profile, in order.
+        """
+
+        return encode_texts(self.model, [profile["query"] for profile in self.dm.profiles.values()], cache=self.embedding_cache)
+
+    def warm_up(self, *subsystems: str) -> float:
+        """
+            Initializes <subsystems> (attribute names such as "db" or "model")
+            and returns the time it took, in seconds.
+        """
+
+        start = time.perf_counter()
+        for subsystem in subsystems:
+            getattr(self, subsystem)
+        return time.perf_counter() - start
 
     def create_db_tables(self) -> None:
 
         for table_name in self.db.schema:
             self.db.create_table(table_name, self.db.schema[table_name])
+        self.db.db_connection.commit()
+        self.db.create_fts_table()
+        for name, scans in self.db.find_full_scans().items():
+            logger.warning(f"{name} query scans a whole table ({'; '.join(scans)}): check the indexes of {self.db.schema_file}")
 
-    def download_offers(self) -> None:
+    def download_offers(self, full: bool = False) -> None:
+        """
+            Downloads offers page by page, newest first, until it reaches the
+            sync watermark (the highest offer id ingested by a previous run) or a
+            page with less than 30 new offers. With <full>, it walks every page
+            until an empty one instead, storing every offer missing from the database.
+            Pages flow through a fetch -> language detection -> embedding -> store
+            pipeline, so network, CPU and disk work overlap. The watermark only
+            moves once every fetched page was stored; after a failed store, the
+            next run walks every page like a full one to fill the gap.
+        """
 
-        new_offers = 0
-        page = 1
+        #initialize the cached property here, not concurrently from the pipeline threads
+        embedding_cache = self.embedding_cache
+        batch_size = int(self.conf.get("EMBED_BATCH_SIZE", 32))
+        #after a failed store, offers newer than the gap are known: walk every page once
+        exhaustive = full or self.db.get_sync_state("offers_incomplete") == "1"
+        watermark = None if exhaustive else int(self.db.get_sync_state("offers_max_id", 0)) or None
+        known_ids = self.db.get_offer_ids(above=watermark)
+        max_seen = 0
+        complete = False
         total = 0
-        while True:
-            offers = self.hr.fetch_offers_by_page(self.conf["RH_OFFERS_URL"], page)
-            new_offers = self.db.add_offers_clean(offers, self.model)
-            total += new_offers
-            if new_offers < 30:
-                break
-            page += 1
-            time.sleep(1)
+
+        def fetch():
+            nonlocal max_seen, complete
+            #incremental runs usually need a page or two: don't prefetch pages that would be thrown away
+            workers = None if watermark is None else 1
+            for offers in self.hr.fetch_pages_concurrently(self.conf["RH_OFFERS_URL"], workers=workers):
+                if offers is None:
+                    return
+                if not offers:
+                    complete = True
+                    return
+                ids = [int(offer['id']) for offer in offers]
+                max_seen = max([max_seen, *ids])
+                new_offers = []
+                for offer, offer_id in zip(offers, ids):
+                    if offer_id not in known_ids and (watermark is None or offer_id > watermark):
+                        known_ids.add(offer_id)
+                        new_offers.append(offer)
+                if new_offers:
+                    yield new_offers
+                if watermark is not None and any(offer_id <= watermark for offer_id in ids):
+                    logger.info(f"Reached sync watermark (offer {watermark})")
+                    complete = True
+                    return
+                if len(new_offers) < 30 and not exhaustive:
+                    complete = True
+                    return
+
+        def detect_languages(offers):
+            return offers, self.db.detect_languages(offers)
+
+        def embed(item):
+            offers, langs = item
+            texts = [offer['big_description'] for offer in offers]
+            return offers, langs, encode_texts(self.model, texts, batch_size, embedding_cache)
+
+        def store(item):
+            nonlocal total
+            total += self.db.insert_offers(*item)
+
+        pipeline = Pipeline("ingestion", maxsize=int(self.conf.get("PIPELINE_QUEUE_SIZE", 4)))
+        pipeline.add_stage("langdetect", detect_languages).add_stage("embed", embed)
+        try:
+            pipeline.run(fetch(), store, "fetch", "store")
+        except Exception as e:
+            #fetched offers may not have been stored: keep the watermark where it was
+            logger.error(f"Offers download stopped: {e}")
+            self.db.set_sync_state("offers_incomplete", 1)
+            complete = False
+        pipeline.log_stats()
+        for stats in pipeline.stats:
+            metrics.count(f"ingestion_{stats.name}_items", stats.items)
+            metrics.observe(f"ingestion_{stats.name}", stats.busy_seconds)
+        if complete and max_seen > int(self.db.get_sync_state("offers_max_id", 0)):
+            self.db.set_sync_state("offers_max_id", max_seen)
+        if complete and exhaustive:
+            self.db.delete_sync_state("offers_incomplete")
         if total:
             logger.info(f"{total} new offers added to database")
         else:
             logger.info("Database already up to date.")
 
+    def get_index(self) -> "EmbeddingIndex | IVFIndex":
+        """
+            Returns the search index: the exact EmbeddingIndex, or, with SEARCH_ANN=1,
+            an IVF index over it persisted next to the database.
+        """
+
+        if self.index is None:
+            from search.EmbeddingIndex import EmbeddingIndex
+            self.index = EmbeddingIndex().load(self.db.db_connection, self.db.offers_table, self.db.vector_dtype, self.model_name)
+            self.db.attach_index(self.index)
+            if self.conf.get("SEARCH_ANN", "0") == "1":
+                from search.IVFIndex import load_or_build
+                self.ann_index = load_or_build(self.ann_index_path(), self.index, int(self.conf.get("SEARCH_ANN_PROBES", 8)))
+        return self.ann_index if self.ann_index is not None else self.index
+
+    def ann_index_path(self) -> str:
+
+        return f"{self.conf['DB_NAME']}.ivf.npz"
+
+    def search(self, query: str, k: int = 10, keywords: str = None, **filters) -> List:
+        """
+            Ranks against <query> the offers selected in SQL by <filters> (see
+            hybrid_search: by default, the offers still valid and not applied to
+            yet) and by the full-text match of <keywords>. Only when both default
+            filters are turned off and nothing else restricts the candidates is
+            the whole index searched, approximately with SEARCH_ANN=1.
+        """
+
+        from search.smart_search import hybrid_search, k_search
+        if keywords is None and filters == {"valid_only": False, "exclude_applied": False}:
+            return k_search(
+                self.model, self.db.db_connection, query, k, self.get_index(), cache=self.embedding_cache, model_name=self.model_name
+            )
+        if keywords is not None and not self.db.fts:
+            logger.warning(f"No {self.db.fts_table} full-text index, run a sync first: ignoring keywords")
+            keywords = None
+        #candidates are scored exactly, even with SEARCH_ANN=1
+        self.get_index()
+        return hybrid_search(
+            self.model, self.db.db_connection, query, k, keywords, index=self.index, cache=self.embedding_cache,
+            table=self.db.offers_table, fts_table=self.db.fts_table, model_name=self.model_name, **filters
+        )
+
+    def search_many(self, queries: List[str], k: int = 10) -> List[List]:
+
+        from search.smart_search import k_search_many
+        return k_search_many(
+            self.model, self.db.db_connection, queries, k, self.get_index(), cache=self.embedding_cache, model_name=self.model_name
+        )
+
+    def report(self) -> None:
+
+        if "embedding_cache" in self.__dict__:
+            self.embedding_cache.flush()
+            self.embedding_cache.log_stats()
+        if self.ann_index is not None and self.ann_index.dirty:
+            self.ann_index.save(self.ann_index_path())
+        metrics.export(
+            self.conf.get("METRICS_PROMETHEUS_FILE", "logs/metrics.prom"),
+            self.conf.get("METRICS_JSON_FILE", "logs/run_summary.json"),
+        )
+
+    def backfill_vectors(self, full: bool = False, processes: int = None) -> int:
+        """
+            Re-embeds with EMBED_MODEL the offers whose vector comes from another
+            model (every offer with <full>), resuming an interrupted backfill.
+            A loaded embedding index follows the new vectors and its IVF index is
+            rebuilt; otherwise the persisted IVF index is dropped, to be rebuilt
+            on the next load. Other processes, such as a running daemon, keep
+            searching the vectors they loaded until they restart.
+        """
+
+        from utils.backfill_vectors import backfill_vectors
+        if processes is None:
+            processes = int(self.conf.get("EMBED_BACKFILL_PROCESSES", 0))
+        count = backfill_vectors(
+            self.db,
+            None if processes > 1 else self.model,
+            processes,
+            int(self.conf.get("EMBED_BACKFILL_BATCH_SIZE", 1024)),
+            int(self.conf.get("EMBED_BATCH_SIZE", 32)),
+            full,
+            None if processes > 1 else self.embedding_cache,
+        )
+        if count and self.ann_index is not None:
+            #the IVF lists point to positions of the index updated in place
+            self.ann_index.build()
+            self.ann_index.save(self.ann_index_path())
+        elif count and os.path.exists(self.ann_index_path()):
+            os.remove(self.ann_index_path())
+        return count
+
+    def archive_offers(self) -> Dict[str, Dict[str, float]]:
+        """
+            Moves the expired offers that were never applied to out of the offers
+            table, compacts the database, and returns (and logs) the size of the
+            offers table and the latency of its hot queries before and after.
+        """
+
+        before = self.measure_offers_table()
+        archived = self.db.archive_expired_offers(
+            self.conf.get("DB_ARCHIVE_DROP_VECTORS", "0") == "1",
+            int(self.conf.get("DB_ARCHIVE_BATCH_SIZE", 5000)),
+        )
+        if archived and self.ann_index is not None:
+            #the IVF lists point to positions of the compacted index
+            self.ann_index.build()
+            self.ann_index.save(self.ann_index_path())
+        vacuum_pages = self.conf.get("DB_VACUUM_PAGES")
+        self.db.compact(int(vacuum_pages) if vacuum_pages else None)
+        after = self.measure_offers_table()
+        for name in before:
+            logger.info(f"{self.db.offers_table} {name}: {before[name]} -> {after[name]}")
+        return {"before": before, "after": after}
+
+    def measure_offers_table(self) -> Dict[str, float]:
+
+        rows, size = self.db.get_table_size(self.db.offers_table)
+        measures = {"rows": rows, "bytes": size}
+        queries = (
+            ("internships_ms", lambda: sum(1 for _ in self.db.get_internships())),
+            ("apprenticeships_ms", lambda: sum(1 for _ in self.db.get_apprenticeships())),
+            ("vectors_ms", lambda: self.db.cursor.execute(
+                f"SELECT id, vector FROM {self.db.offers_table} WHERE vector IS NOT NULL"
+            ).fetchall()),
+        )
+        for name, query in queries:
+            start = time.perf_counter()
+            query()
+            measures[name] = round(1000 * (time.perf_counter() - start), 2)
+        return measures
+
+    def housekeeping(self) -> None:
+        """
+            Periodic maintenance for long-running processes: archives expired
+            offers, re-clusters the IVF index once the corpus outgrew it and lets
+            SQLite refresh its statistics.
+        """
+
+        self.archive_offers()
+        if self.ann_index is not None and self.ann_index.needs_rebuild():
+            self.ann_index.build()
+            self.ann_index.save(self.ann_index_path())
+        self.db.optimize()
+
+    def get_stats(self) -> Dict[str, int]:
+
+        stats = {
+            "offers": self.db.get_offers_count(),
+            "applications": self.db.get_applications_count(),
+            "pending_internships": sum(1 for _ in self.db.get_internships()),
+        }
+        if self.db.archive:
+            stats["archived_offers"] = self.db.get_table_size(self.db.archive_table)[0]
+        return stats
+
     def create_drafts(self) -> None:
 
-        drafts_created = 0
-        offers = list(self.db.get_internships())
-        try:
-            for offer in offers:
-                email = self.dm.create_email(offer, self.conf['DM_ATTACHMENT'])
-                draft = self.dm.create_draft(email)
-                if draft is not None:
-                    self.db.validate_application(offer[0])
-                    application = self.create_application(offer, draft)
-                    self.db.register_application(application, self.db.schema[self.db.application_table][1:-1])
-                    drafts_created += 1
-        except Exception as e:
-            logger.error(f"Application process stopped: {e}")
+        drafts_created, failures = self.deliver_offers(self.dm.create_drafts_many)
         if drafts_created:
             logger.info(f"successfully created {drafts_created} draft(s)")
         else:
             logger.info(f"Couldn't find any new job  !")
+        if failures:
+            logger.warning(f"Failed to create {failures} draft(s)")
 
     def send_emails(self) -> None:
 
-        email_sent = 0
-        #necessary to avoid cursor's reset:
-        offers = list(self.db.get_internships())
-        try:
-            for offer in offers:
-                email = self.dm.create_email(offer, self.conf['DM_ATTACHMENT'])
-                sent_message = self.dm.send_email(email)
-                if sent_message is not None:
-                    self.db.validate_application(offer[0])
-                    application = self.create_application(offer, sent_message)
-                    self.db.register_application(application, self.db.schema[self.db.application_table][1:-1])
-                    email_sent += 1
-        except Exception as e:
-            logger.error(f"Application process stopped: {e}")
+        email_sent, failures = self.deliver_offers(self.dm.send_many)
         if email_sent:
             logger.success(f"Successfully sent {email_sent} application(s)")
         else:
             logger.info(f"Couldn't find any new job offers !")
+        if failures:
+            logger.warning(f"Failed to send {failures} application(s)")
+
+    def deliver_offers(self, deliver_many: Callable[[List], List]) -> Tuple[int, int]:
+        """
+            Builds one email per pending internship and hands them to <deliver_many>
+            in batches, then records every delivered application.
+            Returns the number of delivered and failed emails.
+        """
+
+        delivered = 0
+        failures = 0
+        if self.dm.profiles:
+            #embedding the profiles may write to the embedding cache on its own
+            #connection, which can't commit once the offers cursor holds the read lock
+            self.get_index()
+            self.profile_vectors
+        offers = self.db.get_internships(OfferContact)
+        columns = self.db.schema[self.db.application_table][1:-1]
+        try:
+            while batch := list(islice(offers, self.dm.batch_size)):
+                profiles = self.match_profiles(batch)
+                emails = [
+                    self.dm.create_email(offer, self.conf['DM_ATTACHMENT'], profile)
+                    for offer, profile in zip(batch, profiles)
+                ]
+                results = deliver_many(emails)
+                applications = [
+                    self.create_application(offer, result)
+                    for offer, result in zip(batch, results) if result is not None
+                ]
+                self.db.record_applications(applications, columns)
+                delivered += len(applications)
+                failures += len(batch) - len(applications)
+        except Exception as e:
+            logger.error(f"Application process stopped: {e}")
+        return delivered, failures
+
+    def track_responses(self) -> int:
+        """
+            Flags the applications that got a reply since the last call, from the
+            Gmail history changes since the history id stored in the sync state.
+            The first call only records the current history id.
+            Returns the number of newly answered applications.
+        """
+
+        history_id = self.db.get_sync_state("gmail_history_id")
+        if history_id is None:
+            self.db.set_sync_state("gmail_history_id", self.dm.get_history_id())
+            logger.info("Started tracking replies from now on")
+            return 0
+        thread_ids, history_id = self.dm.fetch_replies(history_id)
+        answered = self.db.record_responses(thread_ids, now_iso8601_utc()) if thread_ids else 0
+        self.db.set_sync_state("gmail_history_id", history_id or self.dm.get_history_id())
+        metrics.count("applications_answered", answered)
+        if answered:
+            logger.success(f"{answered} application(s) got a response")
+        return answered
+
+    def match_profiles(self, offers: List[OfferContact]) -> List[str]:
+        """
+            Returns, for each of <offers>, the name of the DeliveryMachine profile
+            its embedding is the most similar to, or None when no profile is
+            configured or the offer has no vector.
+        """
 
+        if not self.dm.profiles:
+            return [None] * len(offers)
+        self.get_index()
+        names = list(self.dm.profiles)
+        assignments = self.index.assign(self.profile_vectors, [offer.id for offer in offers])
+        return [names[assignments[offer.id][0]] if offer.id in assignments else None for offer in offers]
 
-    def create_application(self, offer: Tuple, email: Dict, attachment=None) -> Tuple:
+    def create_application(self, offer: OfferContact, email: Dict, attachment=None) -> Tuple:
+        #a draft wraps the message it creates
+        message = email.get("message", email)
         return (
             self.conf["DM_SENDER"], #sent_from
-            offer[6],               #sent_to
+            offer.email,            #sent_to
             now_iso8601_utc(),      #date
             email["id"],            #email_id
+            message["threadId"],    #thread_id
             0,                      #got_response
             None,                   #response_date
             attachment,             #attachment
-            offer[0],               #offer_id (foreign key)
+            offer.id,               #offer_id (foreign key)
         )
@@ -0,0 +1,178 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, List, Optional
+from loguru import logger
+
+_END = object()
+
+class StageStats:
+
+    name: str
+    items: int
+    busy_seconds: float
+    max_queue_depth: int
+    queue_depth_total: int
+
+    def __init__(self, name: str):
+
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self.queue_depth_total = 0
+
+    def record_queue_depth(self, depth: int) -> None:
+
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        self.queue_depth_total += depth
+
+    @property
+    def throughput(self) -> float:
+
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+    @property
+    def mean_queue_depth(self) -> float:
+
+        return self.queue_depth_total / self.items if self.items else 0.0
+
+    def as_dict(self) -> dict:
+
+        return {
+            "stage": self.name,
+            "items": self.items,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "throughput": round(self.throughput, 1),
+            "max_queue_depth": self.max_queue_depth,
+            "mean_queue_depth": round(self.mean_queue_depth, 2),
+        }
+
+class Pipeline:
+    """
+        Staged pipeline: a source thread, one thread per stage and a sink that
+        runs in the caller's thread, connected by bounded queues so that memory
+        stays flat and a slow stage applies back-pressure to the previous ones.
+        Each stage function takes an item and returns the item to pass on,
+        or None to drop it.
+    """
+
+    name: str
+    maxsize: int
+    stages: List[tuple[str, Callable[[Any], Any]]]
+    stats: List[StageStats]
+
+    def __init__(self, name: str, maxsize: int = 4):
+
+        self.name = name
+        self.maxsize = maxsize
+        self.stages = []
+        self.stats = []
+        self.abort = threading.Event()
+        self.error: Optional[BaseException] = None
+
+    def add_stage(self, name: str, func: Callable[[Any], Any]) -> "Pipeline":
+
+        self.stages.append((name, func))
+        return self
+
+    def run(self, source: Iterable, sink: Callable[[Any], None], source_name: str = "source", sink_name: str = "sink") -> None:
+        """
+            Feeds every item of <source> through the stages into <sink>.
+            Re-raises the first exception raised by any stage.
+        """
+
+        queues = [queue.Queue(maxsize=self.maxsize) for _ in range(len(self.stages) + 1)]
+        self.stats = [StageStats(source_name)] + [StageStats(name) for name, _ in self.stages] + [StageStats(sink_name)]
+        self.abort.clear()
+        self.error = None
+        threads = [threading.Thread(target=self._run_source, args=(source, queues[0], self.stats[0]), name=f"{self.name}-{source_name}", daemon=True)]
+        for i, (name, func) in enumerate(self.stages):
+            threads.append(threading.Thread(
+                target=self._run_stage,
+                args=(func, queues[i], queues[i + 1], self.stats[i + 1]),
+                name=f"{self.name}-{name}",
+                daemon=True,
+            ))
+        for thread in threads:
+            thread.start()
+        self._run_stage(sink, queues[-1], None, self.stats[-1])
+        for thread in threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def log_stats(self) -> None:
+
+        for stats in self.stats:
+            logger.info(
+                f"[{self.name}] {stats.name}: {stats.items} item(s) in {stats.busy_seconds:.2f}s "
+                f"({stats.throughput:.1f}/s), input queue depth max {stats.max_queue_depth} "
+                f"mean {stats.mean_queue_depth:.2f}"
+            )
+
+    def _fail(self, error: BaseException) -> None:
+
+        if self.error is None:
+            self.error = error
+        self.abort.set()
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+
+        while not self.abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue) -> Any:
+
+        while not self.abort.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _run_source(self, source: Iterable, output: queue.Queue, stats: StageStats) -> None:
+
+        iterator = iter(source)
+        try:
+            while not self.abort.is_set():
+                start = time.perf_counter()
+                item = next(iterator, _END)
+                stats.busy_seconds += time.perf_counter() - start
+                if item is _END:
+                    break
+                stats.items += 1
+                if not self._put(output, item):
+                    break
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            self._put(output, _END)
+
+    def _run_stage(self, func: Callable[[Any], Any], input: queue.Queue, output: Optional[queue.Queue], stats: StageStats) -> None:
+
+        try:
+            while True:
+                stats.record_queue_depth(input.qsize())
+                item = self._get(input)
+                if item is _END:
+                    break
+                start = time.perf_counter()
+                result = func(item)
+                stats.busy_seconds += time.perf_counter() - start
+                stats.items += 1
+                if output is not None and result is not None and not self._put(output, result):
+                    break
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            if output is not None:
+                self._put(output, _END)
@@ -0,0 +1,236 @@
+import sqlite3
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+from utils.vectorize import get_vectors_as_matrix
+from utils.metrics import timed
+from loguru import logger
+
+class EmbeddingIndex:
+    """
+        In-memory index over the offers embeddings.
+        Vectors are kept L2-normalized in one contiguous float32 matrix so that
+        a cosine similarity search is a single matrix-vector product.
+    """
+
+    ids: np.ndarray
+    matrix: np.ndarray
+    size: int
+    positions: dict[int, int]
+    model: Optional[str]
+
+    def __init__(self, dim: int = 0, capacity: int = 1024, model: str = None):
+
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.matrix = np.empty((capacity, dim), dtype=np.float32)
+        self.size = 0
+        self.positions = {}
+        self.model = model
+
+    def __len__(self) -> int:
+
+        return self.size
+
+    def __contains__(self, offer_id: int) -> bool:
+
+        return int(offer_id) in self.positions
+
+    @property
+    def dim(self) -> int:
+
+        return self.matrix.shape[1]
+
+    @timed("index_load")
+    def load(self, conn: sqlite3.Connection, table: str = "Offers", dtype: str = "float32", model: str = None) -> "EmbeddingIndex":
+        """
+            Loads every vector of <table> at once and replaces the index content.
+            <dtype> is the storage type of the BLOB vectors. With <model>, only the
+            vectors produced by that model are loaded, so that the index never
+            mixes embedding spaces.
+        """
+
+        if model is None:
+            rows = conn.execute(f"SELECT id, vector FROM {table} WHERE vector IS NOT NULL").fetchall()
+        else:
+            rows = conn.execute(f"SELECT id, vector FROM {table} WHERE vector IS NOT NULL AND vector_model = ?", (model,)).fetchall()
+            stale = conn.execute(
+                f"SELECT COUNT(*) FROM {table} WHERE vector IS NOT NULL AND vector_model IS NOT ?", (model,)
+            ).fetchone()[0]
+            if stale:
+                logger.warning(f"{stale} vector(s) of {table} table were not produced by {model} and are not searchable: run a backfill")
+        self.model = model
+        self.size = 0
+        self.positions = {}
+        if rows:
+            ids = [row[0] for row in rows]
+            vectors = get_vectors_as_matrix([row[1] for row in rows], dtype)
+            self.ids = np.empty(len(rows), dtype=np.int64)
+            self.matrix = np.empty((len(rows), vectors.shape[1]), dtype=np.float32)
+            self.add(ids, vectors)
+        logger.info(f"Loaded {self.size} vectors from {table} table into the embedding index")
+        return self
+
+    def add(self, ids: Iterable[int], vectors: np.ndarray) -> int:
+        """
+            Appends <vectors> to the index, ignoring ids that are already indexed.
+            Returns the number of vectors actually added.
+        """
+
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        keep = []
+        new_ids = []
+        seen = set()
+        for row, offer_id in enumerate(ids):
+            offer_id = int(offer_id)
+            if offer_id not in self.positions and offer_id not in seen:
+                keep.append(row)
+                new_ids.append(offer_id)
+                seen.add(offer_id)
+        if not keep:
+            return 0
+        vectors = normalize(vectors[keep])
+        if self.size == 0 and self.dim != vectors.shape[1]:
+            self.matrix = np.empty((len(self.ids), vectors.shape[1]), dtype=np.float32)
+        elif self.dim != vectors.shape[1]:
+            raise ValueError(f"Cannot add {vectors.shape[1]}-dim vectors to a {self.dim}-dim index")
+        self._reserve(self.size + len(keep))
+        start, end = self.size, self.size + len(keep)
+        self.ids[start:end] = new_ids
+        self.matrix[start:end] = vectors
+        for position, offer_id in enumerate(new_ids, start):
+            self.positions[offer_id] = position
+        self.size = end
+        return len(keep)
+
+    def remove(self, ids: Iterable[int]) -> int:
+        """
+            Removes <ids> from the index, compacting it in place.
+            Returns the number of vectors actually removed.
+        """
+
+        removed = [self.positions[offer_id] for offer_id in map(int, ids) if offer_id in self.positions]
+        if not removed:
+            return 0
+        keep = np.ones(self.size, dtype=bool)
+        keep[removed] = False
+        size = int(keep.sum())
+        self.ids[:size] = self.ids[:self.size][keep]
+        self.matrix[:size] = self.matrix[:self.size][keep]
+        self.size = size
+        self.positions = {int(offer_id): position for position, offer_id in enumerate(self.ids[:size])}
+        return len(removed)
+
+    def check_query(self, query_vectors: np.ndarray, model: str = None) -> None:
+        """
+            Raises a ValueError when queries embedded by <model> can't be compared
+            with the indexed vectors: another model, or another dimension.
+        """
+
+        if model is not None and self.model is not None and model != self.model:
+            raise ValueError(f"Cannot search vectors of {self.model} with a query embedded by {model}")
+        dim = np.shape(query_vectors)[-1]
+        if self.size and dim != self.dim:
+            raise ValueError(f"Cannot search {self.dim}-dim vectors with a {dim}-dim query")
+
+    @timed("index_search")
+    def search(self, query_vector: np.ndarray, k: int = 10) -> List[Tuple[int, float]]:
+        """
+            Returns the <k> (offer id, cosine similarity) pairs closest to <query_vector>,
+            best first.
+        """
+
+        if self.size == 0 or k <= 0:
+            return []
+        query = normalize(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+        scores = self.matrix[:self.size] @ query
+        k = min(k, self.size)
+        if k < self.size:
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(self.size)
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(self.ids[i]), float(scores[i])) for i in top]
+
+    @timed("index_search_many")
+    def search_many(self, query_vectors: np.ndarray, k: int = 10) -> List[List[Tuple[int, float]]]:
+        """
+            Same as search for each row of <query_vectors>, scoring every query
+            with a single matrix-matrix product.
+        """
+
+        queries = normalize(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        if self.size == 0 or k <= 0:
+            return [[] for _ in queries]
+        scores = self.matrix[:self.size] @ queries.T
+        k = min(k, self.size)
+        if k < self.size:
+            top = np.argpartition(scores, -k, axis=0)[-k:]
+        else:
+            top = np.broadcast_to(np.arange(self.size)[:, None], scores.shape)
+        results = []
+        for column in range(len(queries)):
+            rows = top[:, column]
+            rows = rows[np.argsort(scores[rows, column])[::-1]]
+            results.append([(int(self.ids[i]), float(scores[i, column])) for i in rows])
+        return results
+
+    def assign(self, query_vectors: np.ndarray, offer_ids: Iterable[int] = None) -> dict[int, Tuple[int, float]]:
+        """
+            Maps each offer of <offer_ids> (every indexed offer by default) to the
+            row of <query_vectors> it is the most similar to, and that similarity.
+        """
+
+        if offer_ids is None:
+            positions = np.arange(self.size)
+        else:
+            positions = np.fromiter(
+                (self.positions[offer_id] for offer_id in map(int, offer_ids) if offer_id in self.positions),
+                dtype=np.int64
+            )
+        if len(positions) == 0:
+            return {}
+        queries = normalize(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        scores = self.matrix[positions] @ queries.T
+        best = np.argmax(scores, axis=1)
+        return {
+            int(self.ids[position]): (int(column), float(scores[row, column]))
+            for row, (position, column) in enumerate(zip(positions, best))
+        }
+
+    def search_subset(self, query_vector: np.ndarray, offer_ids: Iterable[int], k: int = 10) -> List[Tuple[int, float]]:
+        """
+            Same as search, restricted to <offer_ids>; ids that are not indexed are ignored.
+        """
+
+        positions = np.fromiter(
+            (self.positions[offer_id] for offer_id in map(int, offer_ids) if offer_id in self.positions),
+            dtype=np.int64
+        )
+        if len(positions) == 0 or k <= 0:
+            return []
+        query = normalize(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+        scores = self.matrix[positions] @ query
+        k = min(k, len(positions))
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(self.ids[positions[i]]), float(scores[i])) for i in top]
+
+    def _reserve(self, size: int) -> None:
+
+        capacity = len(self.ids)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2)
+        ids = np.empty(capacity, dtype=np.int64)
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        ids[:self.size] = self.ids[:self.size]
+        matrix[:self.size] = self.matrix[:self.size]
+        self.ids, self.matrix = ids, matrix
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+        L2-normalizes each row of <vectors>, leaving null rows untouched.
+    """
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
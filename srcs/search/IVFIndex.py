@@ -0,0 +1,199 @@
+import os.path
+from typing import List, Tuple
+import numpy as np
+from search.EmbeddingIndex import EmbeddingIndex, normalize
+from utils.metrics import timed
+from loguru import logger
+
+class IVFIndex:
+    """
+        Approximate nearest-neighbour search over an EmbeddingIndex (inverted file):
+        vectors are clustered with spherical k-means, and a query is only scored
+        against the vectors of the <n_probe> clusters whose centroids are closest
+        to it. A higher <n_probe> gives a better recall for a higher latency.
+        Vectors appended to the underlying index are assigned to their nearest
+        centroid on the next search, without any rebuild.
+    """
+
+    index: EmbeddingIndex
+    centroids: np.ndarray
+    lists: List[np.ndarray]
+    assigned: int
+    built_size: int
+    n_probe: int
+
+    def __init__(self, index: EmbeddingIndex, n_probe: int = 8):
+
+        self.index = index
+        self.n_probe = n_probe
+        self.centroids = np.empty((0, index.dim), dtype=np.float32)
+        self.lists = []
+        self.assigned = 0
+        self.built_size = 0
+        self.dirty = False
+
+    @property
+    def model(self) -> str:
+
+        return self.index.model
+
+    def check_query(self, query_vectors: np.ndarray, model: str = None) -> None:
+
+        self.index.check_query(query_vectors, model)
+
+    @property
+    def n_lists(self) -> int:
+
+        return len(self.centroids)
+
+    @timed("ivf_build")
+    def build(self, n_lists: int = None, iterations: int = 10, sample_per_list: int = 256, seed: int = 0) -> "IVFIndex":
+        """
+            Clusters the indexed vectors into <n_lists> lists (sqrt of the corpus
+            size by default), training k-means on a sample of the vectors.
+        """
+
+        size = self.index.size
+        if size == 0:
+            return self
+        n_lists = max(1, min(n_lists or int(np.sqrt(size)), size))
+        rng = np.random.default_rng(seed)
+        vectors = self.index.matrix[:size]
+        sample = vectors[rng.choice(size, min(size, n_lists * sample_per_list), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=n_lists)
+            empty = counts == 0
+            sums = np.zeros_like(centroids)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums[~empty] = np.add.reduceat(sample[order], starts[~empty], axis=0)
+            #reseed empty clusters on random sample points
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = normalize(sums)
+        self.centroids = centroids.astype(np.float32)
+        self.lists = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        self.assigned = 0
+        self.catch_up()
+        self.built_size = size
+        self.dirty = True
+        logger.info(f"Built a {n_lists}-list IVF index over {size} vectors")
+        return self
+
+    def catch_up(self, chunk_size: int = 65536) -> None:
+        """
+            Assigns the vectors appended to the underlying index since the last call.
+        """
+
+        size = self.index.size
+        if self.assigned >= size or self.n_lists == 0:
+            return
+        new_lists = [[] for _ in range(self.n_lists)]
+        for start in range(self.assigned, size, chunk_size):
+            end = min(start + chunk_size, size)
+            labels = np.argmax(self.index.matrix[start:end] @ self.centroids.T, axis=1)
+            positions = np.arange(start, end, dtype=np.int64)
+            order = np.argsort(labels, kind="stable")
+            bounds = np.searchsorted(labels[order], np.arange(self.n_lists + 1))
+            for list_id in range(self.n_lists):
+                if bounds[list_id] < bounds[list_id + 1]:
+                    new_lists[list_id].append(positions[order[bounds[list_id]:bounds[list_id + 1]]])
+        for list_id, chunks in enumerate(new_lists):
+            if chunks:
+                self.lists[list_id] = np.concatenate([self.lists[list_id], *chunks])
+        self.assigned = size
+        self.dirty = True
+
+    def needs_rebuild(self, growth: float = 2.0) -> bool:
+        """
+            True once the index has grown by <growth> since it was clustered,
+            as the centroids then no longer reflect the corpus well.
+        """
+
+        return self.n_lists == 0 or self.index.size > growth * self.built_size
+
+    @timed("ivf_search")
+    def search(self, query_vector: np.ndarray, k: int = 10, n_probe: int = None) -> List[Tuple[int, float]]:
+        """
+            Returns the approximate <k> (offer id, cosine similarity) pairs closest
+            to <query_vector>, best first.
+        """
+
+        self.catch_up()
+        if self.n_lists == 0 or k <= 0:
+            return self.index.search(query_vector, k)
+        query = normalize(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        probed = np.argpartition(self.centroids @ query, -n_probe)[-n_probe:]
+        positions = np.concatenate([self.lists[list_id] for list_id in probed])
+        if len(positions) == 0:
+            return []
+        scores = self.index.matrix[positions] @ query
+        k = min(k, len(positions))
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(self.index.ids[positions[i]]), float(scores[i])) for i in top]
+
+    def search_many(self, query_vectors: np.ndarray, k: int = 10, n_probe: int = None) -> List[List[Tuple[int, float]]]:
+        """
+            Same as search for each row of <query_vectors>: every query probes its own lists.
+        """
+
+        return [self.search(query_vector, k, n_probe) for query_vector in np.atleast_2d(query_vectors)]
+
+    def save(self, path: str) -> None:
+
+        ids = np.concatenate([self.index.ids[positions] for positions in self.lists]) if self.lists else np.empty(0, dtype=np.int64)
+        list_of = np.concatenate([np.full(len(positions), list_id, dtype=np.int32) for list_id, positions in enumerate(self.lists)]) if self.lists else np.empty(0, dtype=np.int32)
+        np.savez(path, centroids=self.centroids, ids=ids, list_of=list_of, built_size=self.built_size)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: str, index: EmbeddingIndex, n_probe: int = 8) -> "IVFIndex":
+        """
+            Loads the clustering saved at <path> over <index>. Ids that are no
+            longer indexed are dropped, and vectors that were never assigned are
+            assigned to their nearest centroid.
+        """
+
+        ivf = cls(index, n_probe)
+        with np.load(path) as data:
+            if data["centroids"].shape[1] != index.dim:
+                raise ValueError(f"{path} was built for {data['centroids'].shape[1]}-dim vectors, not {index.dim}")
+            ivf.centroids = data["centroids"]
+            ivf.built_size = int(data["built_size"])
+            ids, list_of = data["ids"], data["list_of"]
+        known = np.array([index.positions.get(int(offer_id), -1) for offer_id in ids], dtype=np.int64)
+        keep = known >= 0
+        known, list_of = known[keep], list_of[keep]
+        order = np.argsort(list_of, kind="stable")
+        bounds = np.searchsorted(list_of[order], np.arange(ivf.n_lists + 1))
+        ivf.lists = [known[order[bounds[i]:bounds[i + 1]]] for i in range(ivf.n_lists)]
+        assigned = np.zeros(index.size, dtype=bool)
+        assigned[known] = True
+        missing = np.flatnonzero(~assigned)
+        if len(missing):
+            labels = np.argmax(index.matrix[missing] @ ivf.centroids.T, axis=1)
+            for list_id in np.unique(labels):
+                ivf.lists[list_id] = np.concatenate([ivf.lists[list_id], missing[labels == list_id]])
+            ivf.dirty = True
+        ivf.assigned = index.size
+        return ivf
+
+def load_or_build(path: str, index: EmbeddingIndex, n_probe: int = 8) -> IVFIndex:
+    """
+        Loads the IVF index persisted at <path>, or builds (and saves) it when it
+        is missing, unreadable, or outgrown by the corpus.
+    """
+
+    ivf = None
+    if os.path.exists(path):
+        try:
+            ivf = IVFIndex.load(path, index, n_probe)
+        except Exception as e:
+            logger.warning(f"Couldn't load IVF index {path}: {e}")
+    if ivf is None or ivf.needs_rebuild():
+        ivf = IVFIndex(index, n_probe).build()
+        ivf.save(path)
+    return ivf
@@ -1,27 +1,116 @@
+from datetime import datetime, timezone
 from loguru import logger
-from sentence_transformers import SentenceTransformer
 import sqlite3
-from typing import List, Iterator
-from utils.vectorize import get_vector_str_as_array
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import TYPE_CHECKING, List, Iterator, Type
+from db.OfferRecord import OfferSummary, Record
+from search.EmbeddingIndex import EmbeddingIndex
+from utils.vectorize import encode_texts, get_vectors_as_matrix
 
-def k_search(model: SentenceTransformer, conn: sqlite3.Connection, query: str, k=10) -> List:
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+def k_search(model: "SentenceTransformer", conn: sqlite3.Connection, query: str, k=10, index: EmbeddingIndex = None, dtype: str = "float32", cache=None,
+             record_type: Type[Record] = OfferSummary, model_name: str = None) -> List[Record]:
+    """
+        This function returns the <k> most relevant offers based on <query>,
+        best match first. <index> (an EmbeddingIndex, or an IVFIndex for approximate
+        search) is loaded from the Offers table when not provided,
+        <dtype> being the storage type of its vectors. The query embedding is
+        looked up in <cache> first when one is given. Offers are returned as
+        <record_type> records, only selecting the columns they hold.
+        <model_name> names <model>: only the vectors it produced are searched,
+        and a ValueError is raised if <index> holds another model's vectors.
+    """
+
+    if index is None:
+        index = EmbeddingIndex().load(conn, dtype=dtype, model=model_name)
+    query_vector = encode_texts(model, [query], 1, cache)[0]
+    index.check_query(query_vector, model_name)
+    result = [offer_id for offer_id, _ in index.search(query_vector, k)]
+    return get_offers_by_ids(conn, result, record_type=record_type)
+
+def k_search_many(model: "SentenceTransformer", conn: sqlite3.Connection, queries: List[str], k=10, index: EmbeddingIndex = None,
+                  dtype: str = "float32", cache=None, batch_size: int = 32, record_type: Type[Record] = OfferSummary,
+                  model_name: str = None) -> List[List[Record]]:
+    """
+        Same as k_search for each of <queries>: they are encoded in one batch,
+        scored together against the index, and the offers of every result are
+        fetched in a single query. Returns one list of offers per query.
+    """
+
+    if not queries:
+        return []
+    if index is None:
+        index = EmbeddingIndex().load(conn, dtype=dtype, model=model_name)
+    query_vectors = encode_texts(model, queries, batch_size, cache)
+    index.check_query(query_vectors, model_name)
+    results = [[offer_id for offer_id, _ in ranked] for ranked in index.search_many(query_vectors, k)]
+    offers = {offer.id: offer for offer in get_offers_by_ids(conn, list(dict.fromkeys(
+        offer_id for result in results for offer_id in result
+    )), record_type=record_type)}
+    return [[offers[offer_id] for offer_id in result if offer_id in offers] for result in results]
+
+def hybrid_search(model: "SentenceTransformer", conn: sqlite3.Connection, query: str, k=10, keywords: str = None,
+                  valid_only: bool = True, exclude_applied: bool = True, contract_type: str = None, lang: str = None,
+                  company_id: int = None, index: EmbeddingIndex = None, dtype: str = "float32", cache=None,
+                  table: str = "Offers", fts_table: str = "OffersFts", record_type: Type[Record] = OfferSummary,
+                  model_name: str = None) -> List[Record]:
+    """
+        This function returns the <k> offers most similar to <query> among the
+        offers that pass the filters, best match first. The filters are pushed
+        into the SQL candidate selection: still valid (<valid_only>), not applied
+        to yet (<exclude_applied>), <contract_type>, <lang>, <company_id>, and a
+        full-text match of <keywords> (FTS5 syntax) over the title and descriptions.
+        Only the surviving candidates are then ranked by vector similarity, using
+        the vectors already held by <index> when one is given.
+    """
+
+    conditions = []
+    params = []
+    source = f"{table} o"
+    if keywords:
+        source += f" JOIN {fts_table} f ON f.rowid = o.id"
+        conditions.append(f"{fts_table} MATCH ?")
+        params.append(keywords)
+    if valid_only:
+        conditions.append("o.invalid_at > ?")
+        params.append(datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z'))
+    if exclude_applied:
+        conditions.append("NOT o.has_applied")
+    if index is None:
+        conditions.append("o.vector IS NOT NULL")
+        if model_name is not None:
+            conditions.append("o.vector_model = ?")
+            params.append(model_name)
+    for column, value in (("contract_type", contract_type), ("lang", lang), ("company_id", company_id)):
+        if value is not None:
+            conditions.append(f"o.{column} = ?")
+            params.append(value)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    columns = "o.id" if index is not None else "o.id, o.vector"
+    rows = conn.execute(f"SELECT {columns} FROM {source}{where}", params).fetchall()
+    if not rows:
+        return []
+    query_vector = encode_texts(model, [query], 1, cache)[0]
+    if index is None:
+        index = EmbeddingIndex(capacity=len(rows), model=model_name)
+        index.add([row[0] for row in rows], get_vectors_as_matrix([row[1] for row in rows], dtype))
+    index.check_query(query_vector, model_name)
+    ranked = index.search_subset(query_vector, [row[0] for row in rows], k)
+    return get_offers_by_ids(conn, [offer_id for offer_id, _ in ranked], table, record_type)
+
+def get_offers_by_ids(conn: sqlite3.Connection, offer_ids: List[int], table: str = "Offers",
+                      record_type: Type[Record] = OfferSummary) -> List[Record]:
     """
-        This function returns the <k> most relevant offers based on <query>
+        Returns the <record_type> records of <offer_ids>, in the same order.
     """
 
-    query_vector = model.encode(query)
+    if not offer_ids:
+        return []
+    offers = {}
     cursor = conn.cursor()
-    offers = cursor.execute("SELECT * FROM Offers").fetchall()
-    score_board = [
-        (
-            offer[0], cosine_similarity(
-                query_vector.reshape(1, -1),
-                get_vector_str_as_array(offer[17]).reshape(1, -1))[0][0]
-        )
-        for offer in offers
-    ]
-    score_board.sort(key=lambda x: x[1], reverse=True)
-    result = [item[0] for item in score_board[:k]]
-    cursor.execute(f'SELECT * FROM Offers where id in ({', '.join('?' * len(result))})', result)
-    return cursor.fetchall()
+    for i in range(0, len(offer_ids), 500):
+        chunk = offer_ids[i:i + 500]
+        cursor.execute(f"SELECT {record_type.columns()} FROM {table} where id in ({', '.join('?' * len(chunk))})", chunk)
+        offers.update((offer.id, offer) for offer in map(record_type.from_row, cursor.fetchall()))
+    return [offers[offer_id] for offer_id in offer_ids if offer_id in offers]
@@ -0,0 +1,89 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Iterator, List, Tuple
+import itertools
+import numpy as np
+from utils.metrics import metrics
+from utils.vectorize import encode_texts
+from loguru import logger
+
+if TYPE_CHECKING:
+    from db.DBManager import DBManager
+    from sentence_transformers import SentenceTransformer
+
+#model of the current worker process
+_model = None
+
+def backfill_vectors(db: "DBManager", model: "SentenceTransformer" = None, processes: int = 0, batch_size: int = 1024,
+                     encode_batch_size: int = 32, full: bool = False, cache=None) -> int:
+    """
+        Re-embeds with the EMBED_MODEL of <db> every offer whose vector comes
+        from another model (every offer with <full>), <batch_size> offers at a time.
+        With <processes> greater than 1, batches are encoded by a pool of worker
+        processes that each load the model once; otherwise <model> encodes them,
+        looking embeddings up in <cache> first.
+        Each batch is written along with a checkpoint, so an interrupted backfill
+        resumes after the last batch it wrote. Full and incremental backfills
+        checkpoint under different keys, so that neither resumes the other.
+        Returns the number of re-embedded offers.
+    """
+
+    key = f"backfill-full:{db.model_name}" if full else f"backfill:{db.model_name}"
+    start_id = int(db.get_sync_state(key, 0))
+    if start_id:
+        logger.info(f"Resuming the {db.model_name} backfill after offer {start_id}")
+    batches = iter_batches(db, start_id, batch_size, full)
+    if processes > 1:
+        encoded = encode_in_pool(batches, db.model_name, processes, encode_batch_size)
+    else:
+        encoded = ((ids, encode_texts(model, texts, encode_batch_size, cache)) for ids, texts in batches)
+    done = 0
+    for ids, vectors in encoded:
+        db.update_vectors(ids, vectors, key)
+        done += len(ids)
+        metrics.count("vectors_backfilled", len(ids))
+        logger.info(f"{done} vector(s) re-embedded with {db.model_name}")
+    db.delete_sync_state(key)
+    logger.info(f"Backfill done: {done} vector(s) re-embedded with {db.model_name}")
+    return done
+
+def iter_batches(db: "DBManager", start_id: int, batch_size: int, full: bool) -> Iterator[Tuple[List[int], List[str]]]:
+
+    last_id = start_id
+    while True:
+        rows = db.get_stale_vectors(last_id, batch_size, full)
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        yield [row[0] for row in rows], [row[1] or "" for row in rows]
+
+def encode_in_pool(batches: Iterator[Tuple[List[int], List[str]]], model_name: str, processes: int,
+                   encode_batch_size: int) -> Iterator[Tuple[List[int], np.ndarray]]:
+    """
+        Encodes <batches> in <processes> worker processes, keeping two batches
+        per worker in flight, and yields them in order.
+    """
+
+    executor = ProcessPoolExecutor(max_workers=processes, initializer=_load_model, initargs=(model_name,))
+    in_flight = deque()
+    try:
+        for ids, texts in itertools.islice(batches, 2 * processes):
+            in_flight.append((ids, executor.submit(_encode, texts, encode_batch_size)))
+        while in_flight:
+            ids, future = in_flight.popleft()
+            vectors = future.result()
+            for next_ids, next_texts in itertools.islice(batches, 1):
+                in_flight.append((next_ids, executor.submit(_encode, next_texts, encode_batch_size)))
+            yield ids, vectors
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _load_model(model_name: str) -> None:
+
+    global _model
+    from sentence_transformers import SentenceTransformer
+    _model = SentenceTransformer(model_name)
+
+def _encode(texts: List[str], batch_size: int) -> np.ndarray:
+
+    return np.asarray(_model.encode(texts, batch_size=batch_size), dtype=np.float32)
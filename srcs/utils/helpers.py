@@ -27,12 +27,25 @@ def load_schema(schema_file: str) -> dict:
             #print("type of data = ", type(data))
             return {
                 table: [tuple(column) for column in data[table]]
-                for table in data
+                for table in data if not table.startswith("__")
             }
     except Exception as e:
             logger.error(f"couldn't process file: {schema_file}: {e}")
             return None
 
+def load_indexes(schema_file: str) -> dict:
+    """
+        Returns the indexes declared under the "__indexes__" key of <schema_file>,
+        as {table: [{"name", "columns", "unique", "where"}]}.
+    """
+
+    try:
+        with open(schema_file, 'r') as fp:
+            return json.load(fp).get("__indexes__", {})
+    except Exception as e:
+            logger.error(f"couldn't process file: {schema_file}: {e}")
+            return {}
+
 def now_iso8601_utc():
 
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace('+00:00', 'Z')
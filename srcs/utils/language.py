@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+import atexit
+import hashlib
+import multiprocessing
+import threading
+from langdetect import DetectorFactory, detect
+from langdetect.lang_detect_exception import LangDetectException
+
+#langdetect is randomized: seeding it makes the same text always get the same language
+DetectorFactory.seed = 0
+
+UNKNOWN_LANGUAGE = "unknown"
+MEMO_SIZE = 100000
+#below this many texts, a process pool costs more than it saves
+MIN_PARALLEL_BATCH = 256
+
+_memo: "OrderedDict[str, str]" = OrderedDict()
+_memo_lock = threading.Lock()
+_executor: ProcessPoolExecutor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+def detect_language(text: str) -> str:
+    """
+        Deterministic, memoized language detection of <text>.
+        Returns UNKNOWN_LANGUAGE when no language can be detected.
+    """
+
+    return detect_languages([text])[0]
+
+def detect_languages(texts: List[str], processes: int = 0) -> List[str]:
+    """
+        Detects the language of every text of <texts>, only running langdetect
+        on texts it has not seen yet. Large batches are spread over <processes>
+        worker processes when <processes> is greater than 1.
+    """
+
+    keys = [hash_text(text) for text in texts]
+    found = {}
+    missing = {}
+    with _memo_lock:
+        for key, text in zip(keys, texts):
+            if key in _memo:
+                _memo.move_to_end(key)
+                found[key] = _memo[key]
+            elif key not in found:
+                missing.setdefault(key, text)
+    if missing:
+        if processes > 1 and len(missing) >= MIN_PARALLEL_BATCH:
+            langs = list(_get_executor(processes).map(_detect, missing.values(), chunksize=64))
+        else:
+            langs = [_detect(text) for text in missing.values()]
+        found.update(zip(missing, langs))
+        with _memo_lock:
+            _memo.update(zip(missing, langs))
+            while len(_memo) > MEMO_SIZE:
+                _memo.popitem(last=False)
+    return [found[key] for key in keys]
+
+def hash_text(text: str) -> str:
+
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+def _get_executor(processes: int) -> ProcessPoolExecutor:
+    """
+        The shared pool of <processes> workers, replacing the previous one when
+        the number of workers changed. Workers are spawned rather than forked,
+        as the caller may be running threads.
+    """
+
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != processes:
+            if _executor is not None:
+                _executor.shutdown()
+            _executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+            _executor_workers = processes
+        return _executor
+
+@atexit.register
+def _shutdown_executor() -> None:
+
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+def _detect(text: str) -> str:
+
+    try:
+        return detect(text)
+    except LangDetectException:
+        return UNKNOWN_LANGUAGE
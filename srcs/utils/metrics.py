@@ -0,0 +1,186 @@
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Callable, Dict, Iterator
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+PREFIX = "internshipfinder"
+#latency buckets, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+
+    count: int
+    total: float
+    minimum: float
+    maximum: float
+
+    def __init__(self):
+
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = 0.0
+
+    def observe(self, value: float) -> None:
+
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.total += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def quantile(self, q: float) -> float:
+        """
+            Upper bound of the bucket holding the <q> quantile.
+        """
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.maximum
+
+    def as_dict(self) -> dict:
+
+        return {
+            "count": self.count,
+            "total_seconds": round(self.total, 6),
+            "mean_seconds": round(self.total / self.count, 6) if self.count else 0.0,
+            "min_seconds": round(self.minimum, 6) if self.count else 0.0,
+            "max_seconds": round(self.maximum, 6),
+            "p50_seconds": self.quantile(0.5),
+            "p95_seconds": self.quantile(0.95),
+        }
+
+class Metrics:
+    """
+        Process-wide timers, counters and latency histograms.
+        Everything is a no-op until enable() is called, so that instrumented
+        code only pays for a boolean check when metrics are disabled.
+    """
+
+    enabled: bool
+    counters: Dict[str, float]
+    histograms: Dict[str, Histogram]
+
+    def __init__(self):
+
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def enable(self, enabled: bool = True) -> None:
+
+        self.enabled = enabled
+
+    def reset(self) -> None:
+
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            self.started_at = datetime.now(timezone.utc)
+            self.start = time.perf_counter()
+
+    def count(self, name: str, value: float = 1) -> None:
+
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def timer(self, name: str):
+        """
+            Context manager recording the duration of its block under <name>.
+        """
+
+        if not self.enabled:
+            return nullcontext()
+        return self._timer(name)
+
+    @contextmanager
+    def _timer(self, name: str) -> Iterator[None]:
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def summary(self) -> dict:
+
+        with self.lock:
+            return {
+                "started_at": self.started_at.isoformat(timespec="seconds").replace("+00:00", "Z"),
+                "duration_seconds": round(time.perf_counter() - self.start, 3),
+                "counters": dict(self.counters),
+                "timers": {name: histogram.as_dict() for name, histogram in sorted(self.histograms.items())},
+            }
+
+    def to_prometheus(self) -> str:
+
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{PREFIX}_{name}_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"{PREFIX}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.buckets):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum {histogram.total}")
+                lines.append(f"{metric}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, prometheus_file: str = None, json_file: str = None) -> None:
+
+        if not self.enabled:
+            return
+        if prometheus_file:
+            with open(prometheus_file, "w") as fp:
+                fp.write(self.to_prometheus())
+        if json_file:
+            with open(json_file, "w") as fp:
+                json.dump(self.summary(), fp, indent=2)
+
+metrics = Metrics()
+
+def timed(name: str) -> Callable:
+    """
+        Decorator recording the latency of every call under <name>.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,61 @@
+import argparse
+import sqlite3
+from loguru import logger
+from utils.vectorize import DEFAULT_EMBED_MODEL, VECTOR_DTYPES, get_array_as_vector_blob, get_vector_str_as_array
+
+def migrate_vectors_to_blob(conn: sqlite3.Connection, table: str = "Offers", dtype: str = "float32", batch_size: int = 1000) -> int:
+    """
+        This function converts, in place, the JSON text vectors of <table>
+        into raw <dtype> BLOBs and returns the number of converted rows.
+        Already converted rows are left untouched so it can safely be re-run.
+        When <table> has the vector_model and vector_dim columns, the converted
+        vectors are tagged with their dimension and, unless already tagged,
+        with DEFAULT_EMBED_MODEL, the model that produced every JSON vector.
+    """
+
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unsupported vector dtype: {dtype}")
+    cursor = conn.cursor()
+    columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    tagged = {"vector_model", "vector_dim"} <= columns
+    converted = 0
+    last_id = None
+    while True:
+        rows = cursor.execute(
+            f"SELECT id, vector FROM {table} WHERE typeof(vector) = 'text' AND (? IS NULL OR id > ?) ORDER BY id LIMIT ?",
+            (last_id, last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        vectors = [(offer_id, get_vector_str_as_array(vector)) for offer_id, vector in rows]
+        if tagged:
+            cursor.executemany(
+                f"UPDATE {table} SET vector = ?, vector_model = COALESCE(vector_model, ?), vector_dim = ? WHERE id = ?",
+                [(get_array_as_vector_blob(vector, dtype), DEFAULT_EMBED_MODEL, len(vector), offer_id) for offer_id, vector in vectors]
+            )
+        else:
+            cursor.executemany(
+                f"UPDATE {table} SET vector = ? WHERE id = ?",
+                [(get_array_as_vector_blob(vector, dtype), offer_id) for offer_id, vector in vectors]
+            )
+        conn.commit()
+        converted += len(rows)
+        last_id = rows[-1][0]
+        logger.info(f"{converted} vectors converted to {dtype} BLOBs")
+    if converted:
+        conn.execute("VACUUM")
+    logger.info(f"Vector migration of {table} table done: {converted} row(s) converted")
+    return converted
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Convert JSON text vectors into binary BLOBs.")
+    parser.add_argument("db_name")
+    parser.add_argument("--table", default="Offers")
+    parser.add_argument("--dtype", default="float32", choices=list(VECTOR_DTYPES))
+    args = parser.parse_args()
+    with sqlite3.connect(args.db_name) as conn:
+        migrate_vectors_to_blob(conn, args.table, args.dtype)
+
+if __name__ == '__main__':
+    main()
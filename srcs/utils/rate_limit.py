@@ -0,0 +1,43 @@
+import threading
+import time
+
+class TokenBucket:
+    """
+        Thread-safe token bucket: <rate> tokens are added per second, up to
+        <capacity>, and acquire() blocks until enough tokens are available.
+    """
+
+    rate: float
+    capacity: float
+    tokens: float
+
+    def __init__(self, rate: float, capacity: float = None):
+
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+            Takes <tokens> from the bucket, sleeping as long as needed.
+            Returns the time spent waiting, in seconds.
+        """
+
+        if tokens > self.capacity:
+            raise ValueError(f"Cannot acquire {tokens} tokens from a bucket of {self.capacity}")
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
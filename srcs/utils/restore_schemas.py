@@ -12,7 +12,7 @@ def load_schema(schema_file: str) -> dict:
             #print("type of data = ", type(data))
             return {
                 table: [tuple(column) for column in data[table]]
-                for table in data
+                for table in data if not table.startswith("__")
             }
     except:
             logger.error(f"couldn't process file: {schema_file}")
@@ -1,14 +1,29 @@
-from sentence_transformers import SentenceTransformer
+from typing import TYPE_CHECKING, List, Union
 import json
 import numpy as np
+from utils.metrics import metrics, timed
 
-def get_vector_as_str(model: SentenceTransformer, text: str) -> str:
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+VECTOR_DTYPES = {"float32": np.float32, "float16": np.float16}
+#the model every vector was produced with before vectors recorded their model
+DEFAULT_EMBED_MODEL = "all-MiniLM-L6-v2"
+
+def get_vector_as_str(model: "SentenceTransformer", text: str) -> str:
     """
         This function turns <text> into a vector using <model>, then returns
         its json string representation.
     """
 
     vector = model.encode(text)
+    return get_array_as_vector_str(vector)
+
+def get_array_as_vector_str(vector: np.ndarray) -> str:
+    """
+        Convert a np array into its JSON string representation.
+    """
+
     return json.dumps(vector.tolist())
 
 def get_vector_str_as_array(vector_str: str) -> np.ndarray:
@@ -17,3 +32,66 @@ def get_vector_str_as_array(vector_str: str) -> np.ndarray:
     """
 
     return np.array(json.loads(vector_str), dtype=np.float32)
+
+@timed("embed")
+def encode_texts(model: "SentenceTransformer", texts: List[str], batch_size: int = 32, cache=None) -> np.ndarray:
+    """
+        This function turns every text of <texts> into a vector with a single
+        batched <model> call and returns them as an (n, dim) float32 matrix.
+        When an embedding <cache> is given, only the uncached texts are encoded.
+    """
+
+    metrics.count("embedded_texts", len(texts))
+    if cache is not None:
+        return cache.encode(model, texts, batch_size)
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    with metrics.timer("model_encode"):
+        return np.asarray(model.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+def get_vector_as_blob(model: "SentenceTransformer", text: str, dtype: str = "float32") -> bytes:
+    """
+        This function turns <text> into a vector using <model>, then returns
+        its raw <dtype> bytes, ready to be stored in a BLOB column.
+    """
+
+    vector = model.encode(text)
+    return get_array_as_vector_blob(vector, dtype)
+
+def get_array_as_vector_blob(vector: np.ndarray, dtype: str = "float32") -> bytes:
+    """
+        Convert a np array into its raw <dtype> bytes.
+    """
+
+    return np.asarray(vector, dtype=VECTOR_DTYPES[dtype]).tobytes()
+
+def get_vector_blob_as_array(vector_blob: bytes, dtype: str = "float32") -> np.ndarray:
+    """
+        Convert raw <dtype> bytes back into a np array. float32 blobs are
+        decoded without copying, the returned array is then read-only.
+    """
+
+    vector = np.frombuffer(vector_blob, dtype=VECTOR_DTYPES[dtype])
+    return vector if vector.dtype == np.float32 else vector.astype(np.float32)
+
+def get_vector_as_array(vector: Union[str, bytes], dtype: str = "float32") -> np.ndarray:
+    """
+        Decode a stored vector, whether it is a BLOB or a legacy JSON string.
+    """
+
+    if isinstance(vector, str):
+        return get_vector_str_as_array(vector)
+    return get_vector_blob_as_array(vector, dtype)
+
+def get_vectors_as_matrix(vectors: List[Union[str, bytes]], dtype: str = "float32") -> np.ndarray:
+    """
+        Decode a list of stored vectors into one (n, dim) float32 matrix.
+        When every vector is a BLOB they are decoded in a single np.frombuffer call.
+    """
+
+    if not vectors:
+        return np.empty((0, 0), dtype=np.float32)
+    if all(isinstance(vector, bytes) for vector in vectors):
+        matrix = np.frombuffer(b"".join(vectors), dtype=VECTOR_DTYPES[dtype]).reshape(len(vectors), -1)
+        return matrix.astype(np.float32, copy=False)
+    return np.stack([get_vector_as_array(vector, dtype) for vector in vectors])
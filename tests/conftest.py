@@ -0,0 +1,57 @@
+import os
+import sys
+import pytest
+
+SRCS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "srcs")
+SCHEMA_FILE = os.path.join(SRCS, "db", "schema.example.json")
+sys.path.insert(0, SRCS)
+
+from db.DBManager import DBManager
+
+def db_config(db_name: str = ":memory:", **config) -> dict:
+
+    return {
+        "DB_NAME": db_name,
+        "DB_OFFERS_TABLE": "Offers",
+        "DB_APPLICATION_TABLE": "Applications",
+        "DB_SCHEMA": SCHEMA_FILE,
+        **config,
+    }
+
+def create_tables(db: DBManager) -> DBManager:
+
+    for table_name in db.schema:
+        db.create_table(table_name, db.schema[table_name])
+    db.db_connection.commit()
+    return db
+
+@pytest.fixture
+def db():
+
+    db = create_tables(DBManager(db_config()))
+    yield db
+    db.db_connection.close()
+
+@pytest.fixture
+def template(tmp_path):
+
+    for lang in ("fr", "en"):
+        (tmp_path / f"template_{lang}.html").write_text("<html><body>Bonjour</body></html>")
+    return str(tmp_path / "template_xx.html")
+
+def dm_config(template: str, **config) -> dict:
+
+    conf = {key: "" for key in ("DM_CLIENT_ID", "DM_CLIENT_SECRET", "DM_AUTH_URI", "DM_TOKEN_URI", "DM_GMAIL_BASE_URI")}
+    conf.update({
+        "DM_SENDER": "me@example.com",
+        "DM_EMAIL_TEMPLATE": template,
+        "DM_LABEL_NAME": "InternshipFinder",
+        "DM_QUOTA_UNITS_PER_SECOND": 100000,
+    })
+    conf.update(config)
+    return conf
+
+def make_dm(service, template: str, **config):
+
+    from mailing.DeliveryMachine import DeliveryMachine
+    return DeliveryMachine(dm_config(template, **config), service=service)
@@ -0,0 +1,101 @@
+import itertools
+import time
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+from bench.fake_gmail import FakeGmailService, FakeRequest
+from conftest import make_dm
+from db.OfferRecord import OfferContact
+from utils.rate_limit import TokenBucket
+
+class FailingGmailService(FakeGmailService):
+    """
+        Fails the sends whose rank (from 0) is in <failing>, or the whole batch
+        with <fail_batches>.
+    """
+
+    def __init__(self, failing=(), fail_batches=False):
+
+        super().__init__()
+        self.failing = set(failing)
+        self.fail_batches = fail_batches
+        self.send_calls = itertools.count()
+        self.batches = []
+
+    def send(self, userId, body):
+
+        if next(self.send_calls) in self.failing:
+            def fail():
+                raise HttpError(httplib2.Response({"status": 400}), b"Invalid To header")
+            return FakeRequest(fail)
+        return super().send(userId, body)
+
+    def new_batch_http_request(self, callback=None):
+
+        batch = super().new_batch_http_request(callback)
+        self.batches.append(batch)
+        if self.fail_batches:
+            def fail():
+                raise HttpError(httplib2.Response({"status": 503}), b"Backend Error")
+            batch.execute = fail
+        return batch
+
+def make_emails(dm, count):
+
+    return [dm.create_email(OfferContact(i, f"Offer {i}", f"hr{i}@example.com", "fr")) for i in range(count)]
+
+def test_failed_items_are_none(template):
+
+    service = FailingGmailService(failing={1, 4})
+    dm = make_dm(service, template, DM_BATCH_SIZE=3)
+    results = dm.send_many(make_emails(dm, 6))
+    assert [result is None for result in results] == [False, True, False, False, True, False]
+    assert len(service.batches) == 2
+    #only the delivered messages are labelled
+    assert sorted(service.labelled) == sorted(result["id"] for result in results if result is not None)
+
+def test_missing_emails_are_skipped(template):
+
+    service = FailingGmailService()
+    dm = make_dm(service, template)
+    emails = make_emails(dm, 3)
+    emails[1] = None
+    results = dm.send_many(emails)
+    assert results[1] is None and results[0] is not None and results[2] is not None
+    assert len(service.sent) == 2
+
+def test_failed_batch_returns_none(template):
+
+    service = FailingGmailService(fail_batches=True)
+    dm = make_dm(service, template, DM_BATCH_SIZE=2)
+    assert dm.send_many(make_emails(dm, 4)) == [None] * 4
+    assert service.labelled == {}
+
+def test_create_drafts_many(template):
+
+    service = FailingGmailService()
+    dm = make_dm(service, template)
+    results = dm.create_drafts_many(make_emails(dm, 2))
+    assert [draft["message"]["id"] for draft in results] == [draft["message"]["id"] for draft in service.drafts_created]
+
+def test_quota_throttles_sends(template):
+
+    #the bucket holds 10 sends, the next 5 wait for 0.5s of quota
+    dm = make_dm(FailingGmailService(), template, DM_QUOTA_UNITS_PER_SECOND=1000, DM_BATCH_SIZE=100)
+    emails = make_emails(dm, 15)
+    start = time.monotonic()
+    dm.send_many(emails)
+    assert time.monotonic() - start >= 0.4
+
+def test_token_bucket():
+
+    bucket = TokenBucket(100, 10)
+    assert bucket.acquire(10) == 0
+    start = time.monotonic()
+    waited = bucket.acquire(5)
+    assert waited > 0
+    assert time.monotonic() - start >= 0.04
+    with pytest.raises(ValueError):
+        bucket.acquire(11)
+    with pytest.raises(ValueError):
+        TokenBucket(0)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+@pytest.fixture
+def db(db):
+
+    if not db.create_fts_table():
+        pytest.skip("no FTS5 support")
+    return db
+
+def offer(offer_id: int, city: str, invalid_at: str = "2099-01-01T00:00:00.000Z") -> dict:
+
+    return {
+        "id": offer_id, "title": f"Offer {offer_id}", "little_description": f"Internship in {city}",
+        "big_description": f"Python developer internship in {city}", "salary": "1000", "contract_type": "internship",
+        "email": f"hr{offer_id}@example.com", "full_address": city, "valid_at": "2026-01-01T00:00:00.000Z",
+        "invalid_at": invalid_at, "min_duration": 1, "max_duration": 6, "slug": "offer",
+        "created_at": "2026-01-01T00:00:00.000Z", "company_id": 1,
+    }
+
+def match(db, query: str) -> list:
+
+    return [row[0] for row in db.cursor.execute(f"SELECT rowid FROM {db.fts_table} WHERE {db.fts_table} MATCH ? ORDER BY rowid", (query,))]
+
+def insert(db, offers: list) -> None:
+
+    db.insert_offers(offers, ["en"] * len(offers), np.zeros((len(offers), 4), dtype=np.float32))
+
+def test_index_follows_inserts_updates_and_deletes(db):
+
+    insert(db, [offer(1, "Paris"), offer(2, "London"), offer(3, "London")])
+    assert match(db, "London") == [2, 3]
+    with db.db_connection:
+        db.cursor.execute("UPDATE Offers SET little_description = 'Internship in Berlin', big_description = 'Kotlin internship in Berlin' WHERE id = 3")
+        db.cursor.execute("DELETE FROM Offers WHERE id = 1")
+    assert match(db, "London") == [2]
+    assert match(db, "Berlin") == [3]
+    assert match(db, "Paris") == []
+    db.cursor.execute(f"INSERT INTO {db.fts_table}({db.fts_table}, rank) VALUES('integrity-check', 1)")
+
+def test_archived_offers_leave_the_index(db):
+
+    insert(db, [offer(1, "Paris", "2000-01-01T00:00:00.000Z"), offer(2, "Paris")])
+    assert db.archive_expired_offers() == [1]
+    assert match(db, "Paris") == [2]
+    db.cursor.execute(f"INSERT INTO {db.fts_table}({db.fts_table}, rank) VALUES('integrity-check', 1)")
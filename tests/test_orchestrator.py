@@ -0,0 +1,122 @@
+import json
+import pytest
+from bench.fake_encoder import FakeSentenceTransformer
+from bench.fake_gmail import FakeGmailService
+from mailing.DeliveryMachine import DeliveryMachine
+from conftest import create_tables, db_config, dm_config
+from schedule.Orchestrator import Orchestrator
+
+def make_offer(offer_id: int, **fields) -> dict:
+
+    offer = {
+        "id": offer_id, "title": f"Offer {offer_id}", "little_description": f"Internship {offer_id}",
+        "big_description": f"Python developer internship number {offer_id}", "salary": "1000", "contract_type": "internship",
+        "email": f"hr{offer_id}@example.com", "full_address": "Paris", "valid_at": "2026-01-01T00:00:00.000Z",
+        "invalid_at": "2099-01-01T00:00:00.000Z", "min_duration": 1, "max_duration": 6, "slug": "offer",
+        "created_at": "2026-01-01T00:00:00.000Z", "company_id": 1,
+    }
+    offer.update(fields)
+    return offer
+
+class StubHeadHunter:
+    """
+        Serves <pages> of offers, newest first, then empty pages.
+    """
+
+    def __init__(self, pages):
+
+        self.pages = pages
+        self.fetched = []
+
+    def fetch_pages_concurrently(self, offers_url, start_page=1, end_page=None, workers=None):
+
+        page = start_page
+        while True:
+            self.fetched.append(page)
+            yield self.pages[page - 1] if page <= len(self.pages) else []
+            page += 1
+
+@pytest.fixture
+def make_orchestrator(tmp_path, monkeypatch, template):
+    """
+        Builds an Orchestrator over a database file of <tmp_path>, with the fake
+        encoder, the fake Gmail service and <pages> served by the job API.
+    """
+
+    monkeypatch.chdir(tmp_path)
+    orchestrators = []
+
+    def make(pages=(), **conf):
+        otr = Orchestrator()
+        otr.conf = {
+            **db_config(str(tmp_path / "offers.db")),
+            **dm_config(template, **conf),
+            "RH_OFFERS_URL": "http://offers",
+            "DM_ATTACHMENT": None,
+        }
+        otr.model_name = otr.conf.get("EMBED_MODEL", otr.model_name)
+        otr.model = FakeSentenceTransformer(dim=16)
+        otr.hr = StubHeadHunter(list(pages))
+        otr.dm = DeliveryMachine(otr.conf, service=FakeGmailService())
+        create_tables(otr.db)
+        otr.db.create_fts_table()
+        orchestrators.append(otr)
+        return otr
+
+    yield make
+    for otr in orchestrators:
+        otr.db.db_connection.close()
+
+def test_send_with_profiles_beyond_a_cursor_batch(make_orchestrator, tmp_path):
+
+    profiles = tmp_path / "profiles.json"
+    profiles.write_text(json.dumps({"backend": {"query": "python backend"}, "data": {"query": "data science"}}))
+    #more pending offers than get_internships reads per fetch
+    otr = make_orchestrator(DM_PROFILES=str(profiles), DM_BATCH_SIZE=100)
+    offers = [make_offer(offer_id) for offer_id in range(1, 601)]
+    otr.db.insert_offers(offers, ["en"] * len(offers), otr.model.encode([offer["big_description"] for offer in offers]))
+    assert otr.deliver_offers(otr.dm.send_many) == (600, 0)
+    assert len(otr.dm.service.sent) == 600
+    assert otr.db.get_applications_count() == 600
+
+def test_full_sync_walks_every_page(make_orchestrator):
+
+    pages = [[make_offer(offer_id) for offer_id in range(start, start - 30, -1)] for start in range(150, 0, -30)]
+    otr = make_orchestrator(pages)
+    otr.download_offers()
+    assert otr.db.get_offers_count() == 150
+    with otr.db.db_connection:
+        otr.db.cursor.execute("DELETE FROM Offers WHERE id % 7 = 0")
+    otr.hr.fetched.clear()
+    otr.download_offers()
+    assert otr.hr.fetched == [1]
+    assert otr.db.get_offers_count() == 129
+    otr.hr.fetched.clear()
+    otr.download_offers(full=True)
+    assert otr.hr.fetched == [1, 2, 3, 4, 5, 6]
+    assert otr.db.get_offers_count() == 150
+
+def test_search_defaults_to_pending_offers(make_orchestrator):
+
+    otr = make_orchestrator()
+    offers = [make_offer(offer_id, invalid_at="2000-01-01T00:00:00.000Z") for offer_id in range(1, 11)]
+    offers += [make_offer(offer_id) for offer_id in range(11, 16)]
+    otr.db.insert_offers(offers, ["en"] * len(offers), otr.model.encode([offer["big_description"] for offer in offers]))
+    otr.db.record_applications([("me", "hr11@example.com", "now", "t11", "t11", 0, None, None, 11)], otr.db.schema["Applications"][1:-1])
+    query = "Python developer internship number 3"
+    assert sorted(offer.id for offer in otr.search(query, 10)) == [12, 13, 14, 15]
+    assert sorted(offer.id for offer in otr.search(query, 10, lang="en")) == [12, 13, 14, 15]
+    assert otr.search(query, 1, valid_only=False, exclude_applied=False)[0].id == 3
+
+@pytest.mark.parametrize("deliver", ["send_many", "create_drafts_many"])
+def test_replies_are_matched_on_threads(make_orchestrator, deliver):
+
+    otr = make_orchestrator()
+    offers = [make_offer(offer_id) for offer_id in range(1, 4)]
+    otr.db.insert_offers(offers, ["en"] * len(offers), otr.model.encode([offer["big_description"] for offer in offers]))
+    assert otr.track_responses() == 0
+    assert otr.deliver_offers(getattr(otr.dm, deliver)) == (3, 0)
+    thread_id = otr.db.cursor.execute("SELECT thread_id FROM Applications WHERE offer_id = 2").fetchone()[0]
+    otr.dm.service.receive(thread_id)
+    assert otr.track_responses() == 1
+    assert otr.db.cursor.execute("SELECT offer_id FROM Applications WHERE got_response").fetchall() == [(2,)]
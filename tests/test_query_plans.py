@@ -0,0 +1,21 @@
+from datetime import datetime, timezone
+from db.OfferRecord import OfferContact
+
+def now() -> str:
+
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+def test_internships_plan_uses_indexes(db):
+
+    plan = " | ".join(db.explain(db.internships_query(OfferContact.columns("o")), (now(),)))
+    assert "offers_pending_email" in plan
+    assert "applications_sent_to" in plan
+
+def test_apprenticeships_plan_uses_index(db):
+
+    plan = " | ".join(db.explain(db.apprenticeships_query(OfferContact.columns()), (now(),)))
+    assert "offers_pending_contract" in plan
+
+def test_no_full_scans(db):
+
+    assert db.find_full_scans() == {}
@@ -0,0 +1,66 @@
+import sqlite3
+import pytest
+from bench.fake_gmail import FakeGmailService
+from conftest import SCHEMA_FILE, db_config, make_dm
+from db.DBManager import DBManager
+from utils.helpers import load_schema
+
+@pytest.fixture
+def service():
+
+    return FakeGmailService()
+
+@pytest.fixture
+def dm(service, template):
+
+    return make_dm(service, template)
+
+def test_replies_ignore_own_messages(dm, service):
+
+    start = dm.get_history_id()
+    sent = service.users().messages().send(userId="me", body={"raw": ""}).execute()
+    service.users().drafts().create(userId="me", body={"message": {"raw": ""}}).execute()
+    service.receive(sent["threadId"])
+    thread_ids, history_id = dm.fetch_replies(start)
+    assert thread_ids == {sent["threadId"]}
+    assert history_id == str(service.history_id)
+
+def test_replies_follow_pages(dm, service):
+
+    service.history_page_size = 2
+    start = dm.get_history_id()
+    threads = [f"t{i}" for i in range(7)]
+    for thread_id in threads:
+        service.receive(thread_id)
+    thread_ids, history_id = dm.fetch_replies(start)
+    assert thread_ids == set(threads)
+    assert history_id == str(service.history_id)
+
+def test_replies_resume_from_history_id(dm, service):
+
+    service.receive("old")
+    _, history_id = dm.fetch_replies(dm.get_history_id())
+    service.receive("new")
+    assert dm.fetch_replies(history_id)[0] == {"new"}
+
+def test_expired_history(dm, service):
+
+    start = dm.get_history_id()
+    service.receive("lost")
+    service.expire_history()
+    service.receive("t1")
+    thread_ids, history_id = dm.fetch_replies(start)
+    assert history_id is None
+    assert thread_ids == set()
+
+def test_applications_get_a_thread_id_column(tmp_path):
+
+    path = str(tmp_path / "offers.db")
+    with sqlite3.connect(path) as conn:
+        columns = [column for column in load_schema(SCHEMA_FILE)["Applications"] if column[0] != "thread_id"]
+        conn.execute(f"CREATE TABLE Applications ({', '.join(f'{name} {data_type}' for name, data_type in columns)})")
+        conn.execute("INSERT INTO Applications (sent_to, email_id, got_response) VALUES ('hr@example.com', 'abc', 0)")
+    conn.close()
+    db = DBManager(db_config(path))
+    assert db.record_responses(["abc"], "2026-01-01T00:00:00.000Z") == 1
+    db.db_connection.close()
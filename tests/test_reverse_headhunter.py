@@ -0,0 +1,154 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import json
+import threading
+import time
+import pytest
+from job.ReverseHeadHunter import ReverseHeadHunter
+
+class StubAPI:
+    """
+        Scripted job API: serves client-credentials tokens on /token and pages
+        on /offers?page=N. Each page first answers the statuses queued in
+        <statuses>, then its content (an empty page once <pages> runs out).
+    """
+
+    def __init__(self):
+
+        self.pages = {}
+        self.statuses = {}
+        self.delays = {}
+        self.tokens = 0
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def handler(self):
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+
+                pass
+
+            def reply(self, status, body):
+
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if status == 429:
+                    self.send_header("Retry-After", "0")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with stub.lock:
+                    stub.tokens += 1
+                    token = f"token-{stub.tokens}"
+                self.reply(200, {"access_token": token, "token_type": "Bearer", "expires_in": 3600})
+
+            def do_GET(self):
+
+                page = int(parse_qs(urlparse(self.path).query)["page"][0])
+                with stub.lock:
+                    stub.requests.append((page, self.headers.get("Authorization")))
+                    queued = stub.statuses.get(page)
+                    status = queued.pop(0) if queued else 200
+                time.sleep(stub.delays.get(page, 0))
+                self.reply(status, stub.pages.get(page, []) if status == 200 else {"error": status})
+
+        return Handler
+
+    def requested_pages(self):
+
+        with self.lock:
+            return [page for page, _ in self.requests]
+
+@pytest.fixture
+def api(monkeypatch):
+
+    monkeypatch.setenv("OAUTHLIB_INSECURE_TRANSPORT", "1")
+    stub = StubAPI()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub.handler())
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    stub.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield stub
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def rh(api):
+
+    return ReverseHeadHunter({
+        "RH_CLIENT_ID": "client",
+        "RH_CLIENT_SECRET": "secret",
+        "RH_TOKEN_URL": api.url + "/token",
+        "RH_RATE_LIMIT": 1000,
+        "RH_RETRY_BACKOFF": 0,
+        "RH_MAX_RETRIES": 3,
+        "RH_WORKERS": 3,
+    })
+
+def test_retries_429_and_5xx(api, rh):
+
+    api.pages[1] = [{"id": 1}]
+    api.statuses[1] = [429, 503, 500]
+    assert rh.fetch_page_or_none(api.url + "/offers", 1) == [{"id": 1}]
+    assert api.requested_pages() == [1, 1, 1, 1]
+
+def test_gives_up_after_max_retries(api, rh):
+
+    api.statuses[1] = [503] * 10
+    assert rh.fetch_page_or_none(api.url + "/offers", 1) is None
+    assert api.requested_pages() == [1] * 4
+
+def test_refreshes_token_once_on_401(api, rh):
+
+    api.pages[1] = [{"id": 1}]
+    api.statuses[1] = [401]
+    assert rh.fetch_page_or_none(api.url + "/offers", 1) == [{"id": 1}]
+    assert api.tokens == 2
+    assert [auth for _, auth in api.requests] == ["Bearer token-1", "Bearer token-2"]
+
+def test_does_not_refresh_twice_on_401(api, rh):
+
+    api.statuses[1] = [401, 401, 401]
+    assert rh.fetch_page_or_none(api.url + "/offers", 1) is None
+    assert api.tokens == 2
+    assert api.requested_pages() == [1, 1]
+
+def test_pages_yielded_in_order(api, rh):
+
+    for page in range(1, 7):
+        api.pages[page] = [{"id": page}]
+    #the first pages answer last
+    api.delays = {1: 0.2, 2: 0.1}
+    pages = list(rh.fetch_pages_concurrently(api.url + "/offers", 1, 6))
+    assert pages == [[{"id": page}] for page in range(1, 7)]
+
+def test_failed_page_yielded_as_none(api, rh):
+
+    api.pages = {1: [{"id": 1}], 3: [{"id": 3}]}
+    api.statuses[2] = [404]
+    assert list(rh.fetch_pages_concurrently(api.url + "/offers", 1, 3)) == [[{"id": 1}], None, [{"id": 3}]]
+
+def test_stops_on_empty_page(api, rh):
+
+    for page in range(1, 4):
+        api.pages[page] = [{"id": page}]
+    pages = rh.fetch_pages_concurrently(api.url + "/offers")
+    fetched = []
+    for page in pages:
+        if not page:
+            break
+        fetched.append(page)
+    pages.close()
+    assert fetched == [[{"id": page}] for page in range(1, 4)]
+    time.sleep(0.1)
+    #only the pages already in flight past the empty one were requested
+    assert max(api.requested_pages()) <= 4 + rh.workers
@@ -0,0 +1,50 @@
+import json
+import sqlite3
+import numpy as np
+import pytest
+from conftest import SCHEMA_FILE, db_config
+from db.DBManager import DBManager
+from search.EmbeddingIndex import EmbeddingIndex
+from utils.helpers import load_schema
+from utils.migrate_vectors import migrate_vectors_to_blob
+from utils.vectorize import DEFAULT_EMBED_MODEL
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    """
+        A database file from before vectors were stored as BLOBs tagged with
+        their model: 50 offers with JSON text vectors.
+    """
+
+    path = str(tmp_path / "offers.db")
+    columns = [column for column in load_schema(SCHEMA_FILE)["Offers"] if column not in DBManager.VECTOR_COLUMNS]
+    rng = np.random.default_rng(0)
+    with sqlite3.connect(path) as conn:
+        conn.execute(f"CREATE TABLE Offers ({', '.join(f'{name} {data_type}' for name, data_type in columns)})")
+        for offer_id in range(1, 51):
+            conn.execute("INSERT INTO Offers (id, vector) VALUES (?, ?)", (offer_id, json.dumps(rng.random(8).tolist())))
+    conn.close()
+    return path
+
+def tags(conn: sqlite3.Connection) -> set:
+
+    return set(conn.execute("SELECT vector_model, vector_dim FROM Offers").fetchall())
+
+def test_upgrade_tags_text_vectors(baseline_db):
+
+    db = DBManager(db_config(baseline_db))
+    assert tags(db.db_connection) == {(DEFAULT_EMBED_MODEL, 8)}
+    assert EmbeddingIndex().load(db.db_connection, model=DEFAULT_EMBED_MODEL).size == 50
+    assert migrate_vectors_to_blob(db.db_connection) == 50
+    assert tags(db.db_connection) == {(DEFAULT_EMBED_MODEL, 8)}
+    db.db_connection.close()
+
+def test_migration_before_upgrade(baseline_db):
+
+    with sqlite3.connect(baseline_db) as conn:
+        assert migrate_vectors_to_blob(conn) == 50
+    conn.close()
+    db = DBManager(db_config(baseline_db))
+    assert tags(db.db_connection) == {(DEFAULT_EMBED_MODEL, 8)}
+    assert EmbeddingIndex().load(db.db_connection, model=DEFAULT_EMBED_MODEL).size == 50
+    db.db_connection.close()